@@ -9,6 +9,33 @@ import pyspark.sql.functions as F
 
 source = spark.conf.get("source")
 
+## Explicit bronze schema from the schema registry (Includes/Schema-Registry), set with schema_sources=['orders'] in create_declarative_pipeline.
+## When it is not set, the schema is inferred from the files.
+orders_schema = spark.conf.get("schema.orders", None)
+
+## Set the 'gold_orders_by_date' configuration key to 'streaming' to count only the new silver rows on each update instead of
+## recomputing the counts over all of silver. Each update appends partial counts per order date to a private streaming table, and the
+## gold materialized view sums them, so late orders are added to their day.
+gold_orders_by_date = spark.conf.get("gold_orders_by_date", "materialized_view")
+
+## Set the 'coalesced' configuration key to 'true' to ingest the bundles written by coalesce_landing_files to '<source>/orders_coalesced'
+## instead of the small landed files. Each bundled record keeps the name of the file it landed in, in the source_file column.
+coalesced = spark.conf.get("coalesced", "false").lower() == "true"
+
+
+def orders_reader():
+    reader = (
+            spark
+            .readStream
+            .format("cloudFiles")
+            .option("cloudFiles.format", "json")
+    )
+    ## Use the registry schema and skip inference. Values that do not match it are kept in _rescued_data
+    ## The coalesced bundles also carry the source_file lineage column
+    if orders_schema:
+        return reader.schema(orders_schema + (", source_file STRING" if coalesced else "")).option("rescuedDataColumn", "_rescued_data")
+    return reader.option("cloudFiles.inferColumnTypes", True)
+
 
 ## A. Create the bronze streaming table in your labuser.1_bronze_db schema from a JSON files in your volume
   # NOTE: read_files references the 'source' configuration key from your pipeline settings. 
@@ -16,13 +43,21 @@ source = spark.conf.get("source")
 
 @dp.table(name="1_bronze_db.orders_bronze_demo2")
 def orders_bronze_demo2():
+    orders = (
+            orders_reader()
+            .load(f"{source}/orders_coalesced" if coalesced else f"{source}/orders")
+    )
+
+    ## The bundles carry the landed file name per record, so use it instead of the bundle file name
+    if coalesced:
+        return orders.select(
+                *[column for column in orders.columns if column != "source_file"],
+                F.current_timestamp().alias("processing_time"),
+                F.col("source_file").alias("file_name")
+            )
+
     return (
-            spark
-            .readStream
-            .format("cloudFiles")
-            .option("cloudFiles.format", "json")
-            .option("cloudFiles.inferColumnTypes", True)
-            .load(f"{source}/orders")
+            orders
             .select(
                 "*",
                 F.current_timestamp().alias("processing_time"), 
@@ -46,10 +81,32 @@ def orders_silver_demo2():
 
 
 # ## C. Create the materialized view aggregation from the orders_silver table with the summarization
-@dp.materialized_view(name="3_gold_db.gold_orders_by_date_demo2")
-def orders_by_date_gold_demo2():
-    return (
-        dp.read("2_silver_db.orders_silver_demo2")
-        .groupBy(F.col("order_timestamp").cast("date").alias("order_date"))
-        .agg(F.count("*").alias("total_daily_orders"))
-    )
\ No newline at end of file
+if gold_orders_by_date == "streaming":
+    ## Streaming flavour: each micro-batch counts its new silver rows per order date. The watermark is on the micro-batch time, so
+    ## a batch's counts are written as soon as the watermark moves past it (at the latest by the next update) and no order is dropped
+    ## as late, whatever its order date.
+    @dp.table(name="gold_orders_by_date_partials_demo2", private=True)
+    def orders_by_date_partials_demo2():
+        return (
+            dp.read_stream("2_silver_db.orders_silver_demo2")
+            .withColumn("batch_time", F.current_timestamp())
+            .withWatermark("batch_time", "0 seconds")
+            .groupBy("batch_time", F.col("order_timestamp").cast("date").alias("order_date"))
+            .agg(F.count("*").alias("daily_orders"))
+        )
+
+    @dp.materialized_view(name="3_gold_db.gold_orders_by_date_demo2")
+    def orders_by_date_gold_demo2():
+        return (
+            dp.read("gold_orders_by_date_partials_demo2")
+            .groupBy("order_date")
+            .agg(F.sum("daily_orders").alias("total_daily_orders"))
+        )
+else:
+    @dp.materialized_view(name="3_gold_db.gold_orders_by_date_demo2")
+    def orders_by_date_gold_demo2():
+        return (
+            dp.read("2_silver_db.orders_silver_demo2")
+            .groupBy(F.col("order_timestamp").cast("date").alias("order_date"))
+            .agg(F.count("*").alias("total_daily_orders"))
+        )
@@ -0,0 +1,48 @@
+----------------------------
+-- ORDERS - LAKEFLOW SPARK DECLARATIVE PIPELINE
+-- Schema Registry
+----------------------------
+-- The same pipeline as orders/orders_pipeline.sql, with the bronze reader using the explicit orders schema of the schema registry
+-- (Includes/Schema-Registry) instead of sampling the files to infer one. Only the bronze reader differs, so keep the silver and gold
+-- definitions in sync with orders/orders_pipeline.sql.
+
+  -- NOTE: Create the pipeline with source_folder_names=['schema_excluded'] and schema_sources=['orders'] in create_declarative_pipeline.
+  --       This sets the 'schema.orders' configuration key used below.
+  -- NOTE: Values that do not match the registry schema are kept in the _rescued_data column instead of failing the update.
+-------------------------------------------------------
+
+-- A. Create the bronze streaming table in your workspace.1_bronze_db schema from the JSON files in your volume
+CREATE OR REFRESH STREAMING TABLE 1_bronze_db.orders_bronze_demo2 
+AS 
+SELECT 
+  *,
+  current_timestamp() AS processing_time,
+  _metadata.file_name AS source_file
+FROM STREAM read_files(
+    "${source}/orders",
+    format => 'JSON',
+    schema => '${schema.orders}',            -- Registry schema, no inference
+    rescuedDataColumn => '_rescued_data'
+);
+
+
+-- B. Create the silver streaming table in your workspace.2_silver_db schema (database)
+CREATE OR REFRESH STREAMING TABLE 2_silver_db.orders_silver_demo2 
+AS 
+SELECT 
+  order_id,
+  timestamp(order_timestamp) AS order_timestamp, 
+  customer_id,
+  notifications
+FROM STREAM 1_bronze_db.orders_bronze_demo2;
+
+
+-- C. Create the materialized view aggregation from the orders_silver table with the summarization
+CREATE OR REFRESH MATERIALIZED VIEW 3_gold_db.gold_orders_by_date_demo2 
+AS 
+SELECT 
+  date(order_timestamp) AS order_date, 
+  count(*) AS total_daily_orders
+FROM 2_silver_db.orders_silver_demo2
+GROUP BY date(order_timestamp);
+---------------------------------------------------------
@@ -2,11 +2,38 @@
 ## Documentation: https://docs.databricks.com/aws/en/ldp/developer/python-ref
 
 
+import json
 from pyspark import pipelines as dp
 import pyspark.sql.functions as F
 
 source = spark.conf.get("source")
 
+## Explicit bronze schema from the schema registry (Includes/Schema-Registry), set with schema_sources=['orders'] in create_declarative_pipeline.
+## When it is not set, the schema is inferred from the files.
+orders_schema = spark.conf.get("schema.orders", None)
+
+## Compiled rule set for the silver table (Includes/rules/orders_silver_demo3.json), set with rule_sets=[...] in create_declarative_pipeline.
+## When it is set, it replaces the expectation decorators on orders_silver_demo3.
+orders_silver_rules = spark.conf.get("rules.orders_silver_demo3", None)
+
+## Set the 'gold_orders_by_date' configuration key to 'streaming' to count only the new silver rows on each update instead of
+## recomputing the counts over all of silver. Each update appends partial counts per order date to a private streaming table, and the
+## gold materialized view sums them, so late orders are added to their day.
+gold_orders_by_date = spark.conf.get("gold_orders_by_date", "materialized_view")
+
+
+def orders_reader():
+    reader = (
+            spark
+            .readStream
+            .format("cloudFiles")
+            .option("cloudFiles.format", "json")
+    )
+    ## Use the registry schema and skip inference. Values that do not match it are kept in _rescued_data
+    if orders_schema:
+        return reader.schema(orders_schema).option("rescuedDataColumn", "_rescued_data")
+    return reader.option("cloudFiles.inferColumnTypes", True)
+
 
 ## A. Create the bronze streaming table in your labuser.1_bronze_db schema from a JSON files in your volume
   # NOTE: read_files references the 'source' configuration key from your pipeline settings. 
@@ -15,11 +42,7 @@ source = spark.conf.get("source")
 @dp.table(name="1_bronze_db.orders_bronze_demo3")
 def orders_bronze_demo2():
     return (
-            spark
-            .readStream
-            .format("cloudFiles")
-            .option("cloudFiles.format", "json")
-            .option("cloudFiles.inferColumnTypes", True)
+            orders_reader()
             .load(f"{source}/orders")
             .select(
                 "*",
@@ -30,31 +53,121 @@ def orders_bronze_demo2():
 
 
 ## B. Create the silver streaming table in your labuser.2_silver_db schema (database)
-@dp.table(name="2_silver_db.orders_silver_demo3")
-
-# Expectations
-@dp.expect("valid_notifications", "notifications IN ('Y','x')")
-@dp.expect_or_drop("valid_date", F.col("order_timestamp") > "2021-12-26")
-@dp.expect_or_fail("valid_id", F.col("customer_id").isNotNull())
-
-def orders_silver_demo3():
-    return (
-        dp.read_stream("1_bronze_db.orders_bronze_demo3")
-            .select(
+def orders_silver_columns(orders):
+    return orders.select(
                 "order_id",
                 F.col("order_timestamp").cast("timestamp").alias("order_timestamp"),
                 "customer_id",
                 "notifications"
             )
+
+
+def create_quarantined_table(name: str, source: str, quarantine_name: str, quarantine_rules: dict,
+                             transform = None, expect: dict = {}, expect_or_fail: dict = {}):
+    """
+    Defines a streaming table that routes the rows failing any of quarantine_rules to a quarantine streaming table instead of dropping them.
+
+    The rules (name -> SQL predicate) are evaluated once per row in a private streaming table that reads the source once and adds a
+    failed_rules array with the names of the rules the row failed. A predicate that evaluates to NULL counts as failed. The table and the
+    quarantine table both read that private table, so passing and failing rows come from the same scan of the source.
+    expect_or_fail expectations are applied to the private table, so every row is checked before it is routed and a row failing one
+    stops the update even if it also fails a quarantine rule. expect (warn) expectations are applied to the table.
+    """
+    flagged_name = f"{name.split('.')[-1]}_flagged"
+    transform = transform or (lambda df: df)
+    failed_rules = F.filter(
+        F.array(*[F.when(~F.coalesce(F.expr(predicate), F.lit(False)), F.lit(rule)) for rule, predicate in quarantine_rules.items()]),
+        lambda rule: rule.isNotNull()
     )
 
+    def flagged():
+        return transform(dp.read_stream(source)).withColumn("failed_rules", failed_rules)
 
+    def passed():
+        return dp.read_stream(flagged_name).filter(F.size("failed_rules") == 0).drop("failed_rules")
 
-# ## C. Create the materialized view aggregation from the orders_silver table with the summarization
-@dp.materialized_view(name="3_gold_db.gold_orders_by_date_demo3")
-def orders_by_date_gold_demo2():
+    ## Expectations are applied before the table is defined, the same order as stacked decorators
+    if expect_or_fail:
+        flagged = dp.expect_all_or_fail(expect_or_fail)(flagged)
+    dp.table(name=flagged_name, private=True)(flagged)
+
+    if expect:
+        passed = dp.expect_all(expect)(passed)
+    dp.table(name=name)(passed)
+
+    @dp.table(name=quarantine_name)
+    def quarantined():
+        return dp.read_stream(flagged_name).filter(F.size("failed_rules") > 0).withColumn("quarantine_time", F.current_timestamp())
+
+
+def apply_rule_set(df, compiled_rules: dict):
+    """
+    Checks every rule of a compiled rule set (see Includes/Rule-Engine) in one pass: one projection adds a dq_<rule> flag column per rule,
+    then a single filter drops the rows failing a 'drop' rule and stops the update on a 'fail' rule. dq_severity is added for kept rows.
+    """
     return (
-        dp.read("2_silver_db.orders_silver_demo3")
-        .groupBy(F.col("order_timestamp").cast("date").alias("order_date"))
-        .agg(F.count("*").alias("total_daily_orders"))
-    )
\ No newline at end of file
+        df.select("*", *[F.expr(expression).alias(name) for name, expression in compiled_rules["flags"].items()])
+          .filter(F.expr(compiled_rules["filter"]))
+          .withColumn("dq_severity", F.expr(compiled_rules["severity"]))
+    )
+
+
+if orders_silver_rules:
+    @dp.table(name="2_silver_db.orders_silver_demo3")
+    def orders_silver_demo3():
+        return apply_rule_set(orders_silver_columns(dp.read_stream("1_bronze_db.orders_bronze_demo3")), json.loads(orders_silver_rules))
+elif spark.conf.get("quarantine", "false").lower() == "true":
+    ## Set the 'quarantine' configuration key to 'true' to keep the rows failing valid_date in 2_silver_db.orders_quarantine_demo3,
+    ## with the names of the failed rules, instead of dropping them
+    create_quarantined_table(
+        name="2_silver_db.orders_silver_demo3",
+        source="1_bronze_db.orders_bronze_demo3",
+        quarantine_name="2_silver_db.orders_quarantine_demo3",
+        quarantine_rules={"valid_date": "order_timestamp > '2021-12-26'"},
+        transform=orders_silver_columns,
+        expect={"valid_notifications": "notifications IN ('Y','x')"},
+        expect_or_fail={"valid_id": "customer_id IS NOT NULL"}
+    )
+else:
+    @dp.table(name="2_silver_db.orders_silver_demo3")
+
+    # Expectations
+    @dp.expect("valid_notifications", "notifications IN ('Y','x')")
+    @dp.expect_or_drop("valid_date", F.col("order_timestamp") > "2021-12-26")
+    @dp.expect_or_fail("valid_id", F.col("customer_id").isNotNull())
+
+    def orders_silver_demo3():
+        return orders_silver_columns(dp.read_stream("1_bronze_db.orders_bronze_demo3"))
+
+
+
+# ## C. Create the materialized view aggregation from the orders_silver table with the summarization
+if gold_orders_by_date == "streaming":
+    ## Streaming flavour: each micro-batch counts its new silver rows per order date. The watermark is on the micro-batch time, so
+    ## a batch's counts are written as soon as the watermark moves past it (at the latest by the next update) and no order is dropped
+    ## as late, whatever its order date.
+    @dp.table(name="gold_orders_by_date_partials_demo3", private=True)
+    def orders_by_date_partials_demo3():
+        return (
+            dp.read_stream("2_silver_db.orders_silver_demo3")
+            .withColumn("batch_time", F.current_timestamp())
+            .withWatermark("batch_time", "0 seconds")
+            .groupBy("batch_time", F.col("order_timestamp").cast("date").alias("order_date"))
+            .agg(F.count("*").alias("daily_orders"))
+        )
+
+    @dp.materialized_view(name="3_gold_db.gold_orders_by_date_demo3")
+    def orders_by_date_gold_demo2():
+        return (
+            dp.read("gold_orders_by_date_partials_demo3")
+            .groupBy("order_date")
+            .agg(F.sum("daily_orders").alias("total_daily_orders"))
+        )
+else:
+    @dp.materialized_view(name="3_gold_db.gold_orders_by_date_demo3")
+    def orders_by_date_gold_demo2():
+        return (
+            dp.read("2_silver_db.orders_silver_demo3")
+            .groupBy(F.col("order_timestamp").cast("date").alias("order_date"))
+            .agg(F.count("*").alias("total_daily_orders"))
+        )
@@ -0,0 +1,59 @@
+----------------------------
+-- ORDERS SPARK DECLARATIVE PIPELINE
+-- Data Quality Rule Set
+----------------------------
+-- The same pipeline as orders/orders_pipeline.sql, with the silver expectations taken from the rule set file
+-- Includes/rules/orders_silver_demo3.json instead of CONSTRAINT clauses. Every rule is checked in one projection of dq_<rule> flag
+-- columns and one filter, so adding rules does not add passes over the data.
+
+  -- NOTE: Create the pipeline with source_folder_names=['rules_excluded'] and rule_sets=['./Includes/rules/orders_silver_demo3.json']
+  --       in create_declarative_pipeline. This sets the 'rules.orders_silver_demo3.*' configuration keys used below.
+  -- NOTE: Rows failing a 'drop' rule are removed, a 'fail' rule stops the update, and 'warn' rules only set their flag column.
+
+------------------------------------------------------------------
+-- PIPELINE CODE
+------------------------------------------------------------------
+-- Create the bronze streaming table in your labuser.1_bronze_db schema (database) and ingest the JSON files
+CREATE OR REFRESH STREAMING TABLE 1_bronze_db.orders_bronze_demo3
+AS 
+SELECT 
+  *,
+  current_timestamp() AS processing_time,
+  _metadata.file_name AS source_file
+FROM STREAM read_files(
+    "${source}/orders",  -- Uses the source configuration variable set in the pipeline settings
+    format => 'JSON'
+);
+
+
+-- Create the silver streaming table in your labuser.2_silver_db schema (database) with the compiled rule set
+CREATE OR REFRESH STREAMING TABLE 2_silver_db.orders_silver_demo3
+AS 
+SELECT 
+  *,
+  ${rules.orders_silver_demo3.severity} AS dq_severity  -- Highest severity of the rules the row failed
+FROM (
+  SELECT 
+    *,
+    ${rules.orders_silver_demo3.flags}                  -- One dq_<rule> flag column per rule, TRUE when the row fails the rule
+  FROM (
+    SELECT 
+      order_id,
+      timestamp(order_timestamp) AS order_timestamp, 
+      customer_id,
+      notifications 
+    FROM STREAM 1_bronze_db.orders_bronze_demo3
+  )
+)
+WHERE ${rules.orders_silver_demo3.filter};              -- Drops the rows failing a 'drop' rule and raises an error on a 'fail' rule
+
+
+-- Create the materialized view aggregation from the orders_silver_demo3 with the summarization
+CREATE OR REFRESH MATERIALIZED VIEW 3_gold_db.gold_orders_by_date_demo3 
+AS 
+SELECT 
+  date(order_timestamp) AS order_date, 
+  count(*) AS total_daily_orders
+FROM 2_silver_db.orders_silver_demo3   
+GROUP BY date(order_timestamp);
+------------------------------------------------------------------
@@ -0,0 +1,58 @@
+----------------------------
+-- ORDERS SPARK DECLARATIVE PIPELINE
+-- Schema Registry
+----------------------------
+-- The same pipeline as orders/orders_pipeline.sql, with the bronze reader using the explicit orders schema of the schema registry
+-- (Includes/Schema-Registry) instead of sampling the files to infer one. Only the bronze reader differs, so keep the silver and gold
+-- definitions in sync with orders/orders_pipeline.sql.
+
+  -- NOTE: Create the pipeline with source_folder_names=['schema_excluded'] and schema_sources=['orders'] in create_declarative_pipeline.
+  --       This sets the 'schema.orders' configuration key used below.
+  -- NOTE: Values that do not match the registry schema are kept in the _rescued_data column instead of failing the update.
+
+------------------------------------------------------------------
+-- PIPELINE CODE
+------------------------------------------------------------------
+-- Create the bronze streaming table in your labuser.1_bronze_db schema (database) and ingest the JSON files
+CREATE OR REFRESH STREAMING TABLE 1_bronze_db.orders_bronze_demo3
+AS 
+SELECT 
+  *,
+  current_timestamp() AS processing_time,
+  _metadata.file_name AS source_file
+FROM STREAM read_files(
+    "${source}/orders",
+    format => 'JSON',
+    schema => '${schema.orders}',            -- Registry schema, no inference
+    rescuedDataColumn => '_rescued_data'
+);
+
+
+-- Create the silver streaming table in your labuser.2_silver_db schema (database) with data expectations
+CREATE OR REFRESH STREAMING TABLE 2_silver_db.orders_silver_demo3
+  (
+    -- Check for a 'Y' or 'x' in the notifications column, returns a warning
+    CONSTRAINT valid_notifications EXPECT (notifications IN ('Y','x')),
+    -- Drop row if not a valid date (set to 2021-12-26)
+    CONSTRAINT valid_date EXPECT (order_timestamp > "2021-12-26") ON VIOLATION DROP ROW,
+    -- Fail pipeline if null
+    CONSTRAINT valid_id EXPECT (customer_id IS NOT NULL) ON VIOLATION FAIL UPDATE
+  )
+AS 
+SELECT 
+  order_id,
+  timestamp(order_timestamp) AS order_timestamp, 
+  customer_id,
+  notifications 
+FROM STREAM 1_bronze_db.orders_bronze_demo3; 
+
+
+-- Create the materialized view aggregation from the orders_silver_demo3 with the summarization
+CREATE OR REFRESH MATERIALIZED VIEW 3_gold_db.gold_orders_by_date_demo3 
+AS 
+SELECT 
+  date(order_timestamp) AS order_date, 
+  count(*) AS total_daily_orders
+FROM 2_silver_db.orders_silver_demo3   
+GROUP BY date(order_timestamp);
+------------------------------------------------------------------
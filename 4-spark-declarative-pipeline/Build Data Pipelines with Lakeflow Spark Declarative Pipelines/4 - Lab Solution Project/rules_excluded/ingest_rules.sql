@@ -0,0 +1,77 @@
+----------------------------------------------------
+-- SOLUTION: SPARK DECLARATIVE PIPELINE WITH A DATA QUALITY RULE SET
+----------------------------------------------------
+-- The same pipeline as solution/ingest.sql, with the silver expectations taken from the rule set file
+-- Includes/rules/employees_silver_lab4_solution.json instead of CONSTRAINT clauses.
+
+  -- NOTE: Create the pipeline with source_folder_names=['rules_excluded'] and rule_sets=['./Includes/rules/employees_silver_lab4_solution.json']
+  --       in create_declarative_pipeline. This sets the 'rules.employees_silver_lab4_solution.*' configuration keys used below.
+
+
+--------------------
+-- CSV -> BRONZE
+--------------------
+CREATE OR REFRESH STREAMING TABLE lab_1_bronze_db.employees_bronze_lab4_solution
+AS
+SELECT 
+  *,
+  current_timestamp() AS ingestion_time,
+  _metadata.file_name as raw_file_name
+FROM STREAM read_files(
+  '${source}',                     -- Configuration parameter to data source files
+  format => 'CSV',
+  header => 'true'
+);
+
+
+--------------------
+-- BRONZE -> SILVER
+--------------------
+CREATE OR REFRESH STREAMING TABLE lab_2_silver_db.employees_silver_lab4_solution
+AS
+SELECT
+  *,
+  ${rules.employees_silver_lab4_solution.severity} AS dq_severity  -- Highest severity of the rules the row failed
+FROM (
+  SELECT
+    *,
+    ${rules.employees_silver_lab4_solution.flags}                  -- One dq_<rule> flag column per rule
+  FROM (
+    SELECT
+      EmployeeID,
+      FirstName,
+      upper(Country) AS Country,
+      Department,
+      Salary,
+      HireDate,
+      date_format(HireDate, 'MMMM') AS HireMonthName,
+      year(HireDate) AS HireYear, 
+      Operation
+    FROM STREAM lab_1_bronze_db.employees_bronze_lab4_solution
+  )
+)
+WHERE ${rules.employees_silver_lab4_solution.filter};
+
+
+--------------------
+-- SILVER -> GOLD
+--------------------
+
+-- MV 1 
+CREATE OR REFRESH MATERIALIZED VIEW lab_3_gold_db.employees_by_country_gold_lab4_solution
+AS
+SELECT 
+  Country,
+  count(*) AS TotalEmployees,
+  sum(Salary) AS TotalSalary
+FROM lab_2_silver_db.employees_silver_lab4_solution
+GROUP BY Country;
+
+-- MV 2
+CREATE OR REFRESH MATERIALIZED VIEW lab_3_gold_db.salary_by_department_gold_lab4_solution
+AS
+SELECT
+  Department,
+  sum(Salary) AS TotalSalary
+FROM lab_2_silver_db.employees_silver_lab4_solution
+GROUP BY Department;
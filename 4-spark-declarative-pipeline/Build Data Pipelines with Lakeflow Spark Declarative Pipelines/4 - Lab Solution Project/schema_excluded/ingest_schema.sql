@@ -0,0 +1,76 @@
+----------------------------------------------------
+-- SOLUTION: SPARK DECLARATIVE PIPELINE WITH THE SCHEMA REGISTRY
+----------------------------------------------------
+-- The same pipeline as solution/ingest.sql, with the bronze reader using the explicit employees schema of the schema registry
+-- (Includes/Schema-Registry) instead of sampling the CSV files to infer one. Only the bronze reader differs, so keep the silver and gold
+-- definitions in sync with solution/ingest.sql.
+
+  -- NOTE: Create the pipeline with source_folder_names=['schema_excluded'] and schema_sources=['employees'] in create_declarative_pipeline.
+  --       This sets the 'schema.employees' configuration key used below.
+  -- NOTE: Values that do not match the registry schema are kept in the _rescued_data column instead of failing the update.
+
+
+--------------------
+-- CSV -> BRONZE
+--------------------
+CREATE OR REFRESH STREAMING TABLE lab_1_bronze_db.employees_bronze_lab4_solution -- Modified to ST
+AS
+SELECT 
+  *,
+  current_timestamp() AS ingestion_time,
+  _metadata.file_name as raw_file_name
+FROM STREAM read_files(            -- Add STREAM         
+  '${source}',                     -- Configuration parameter to data source files
+  format => 'CSV',
+  header => 'true',
+  schema => '${schema.employees}',  -- Registry schema, no inference
+  rescuedDataColumn => '_rescued_data'
+);
+
+
+--------------------
+-- BRONZE -> SILVER
+--------------------
+CREATE OR REFRESH STREAMING TABLE lab_2_silver_db.employees_silver_lab4_solution -- Modified to ST
+(
+  CONSTRAINT check_country EXPECT (Country IN ('US','GR')),
+  CONSTRAINT check_salary EXPECT (Salary > 0),
+  CONSTRAINT check_null_id EXPECT (EmployeeID IS NOT NULL) ON VIOLATION DROP ROW
+)
+AS
+SELECT
+  EmployeeID,
+  FirstName,
+  upper(Country) AS Country,
+  Department,
+  Salary,
+  HireDate,
+  date_format(HireDate, 'MMMM') AS HireMonthName,
+  year(HireDate) AS HireYear, 
+  Operation
+FROM STREAM lab_1_bronze_db.employees_bronze_lab4_solution;    -- Add STREAM keyword
+
+
+
+--------------------
+-- SILVER -> GOLD
+--------------------
+
+-- MV 1 
+CREATE OR REFRESH MATERIALIZED VIEW lab_3_gold_db.employees_by_country_gold_lab4_solution -- Modified to MV
+AS
+SELECT 
+  Country,
+  count(*) AS TotalEmployees,
+  sum(Salary) AS TotalSalary
+FROM lab_2_silver_db.employees_silver_lab4_solution
+GROUP BY Country;
+
+-- MV 2
+CREATE OR REFRESH MATERIALIZED VIEW lab_3_gold_db.salary_by_department_gold_lab4_solution  -- Modified to MV
+AS
+SELECT
+  Department,
+  sum(Salary) AS TotalSalary
+FROM lab_2_silver_db.employees_silver_lab4_solution
+GROUP BY Department;
\ No newline at end of file
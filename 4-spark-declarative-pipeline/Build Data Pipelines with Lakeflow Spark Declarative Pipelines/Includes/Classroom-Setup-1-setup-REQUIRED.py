@@ -3,38 +3,42 @@
 
 # COMMAND ----------
 
+## Set force_setup_reset = True in the calling notebook before running this setup to force a full reset of the labuser's volume.
+## Otherwise, steps that already completed with the same inputs (and whose files were not changed since) are skipped.
+force_setup_reset = globals().get('force_setup_reset', False)
+
+source_volume = '/Volumes/dbacademy_retail/v01/retail-pipeline'
+landing_folders = ['customers', 'orders', 'status']
+
+
 ## Create catalogs for the course
 create_schemas(in_catalog = DA.catalog_name, schema_names = ['1_bronze_db', '2_silver_db', '3_gold_db'])
 
 
 ## Create directories in the specified volume
-create_directory_in_user_volume(user_default_volume_path = DA.paths.working_dir, create_folders = ['customers', 'orders', 'status'])
-
-
-## Delete all files in the labuser's volume to reset the class if necessary. Otherwise does nothing.
-delete_source_files(f'{DA.paths.working_dir}/customers/')
-delete_source_files(f'{DA.paths.working_dir}/orders/')
-delete_source_files(f'{DA.paths.working_dir}/status/')
+create_directory_in_user_volume(user_default_volume_path = DA.paths.working_dir, create_folders = landing_folders)
 
 
-##
-## Start each directory in the labuser's volume with one file.
-##
+def reset_landing_folders():
+    ## Delete all files in the labuser's volume to reset the class if necessary. Otherwise does nothing.
+    for folder in landing_folders:
+        delete_source_files(f'{DA.paths.working_dir}/{folder}/', mode = 'parallel')
 
-## Customers
-copy_files(copy_from='/Volumes/dbacademy_retail/v01/retail-pipeline/customers/stream_json', 
-           copy_to=f'{DA.paths.working_dir}/customers', 
-           n=1)
+    ##
+    ## Start each directory in the labuser's volume with one file (customers, orders and status).
+    ##
+    for folder in landing_folders:
+        copy_files(copy_from=f'{source_volume}/{folder}/stream_json', 
+                   copy_to=f'{DA.paths.working_dir}/{folder}', 
+                   n=1)
 
-## Orders
-copy_files(copy_from='/Volumes/dbacademy_retail/v01/retail-pipeline/orders/stream_json', 
-           copy_to=f'{DA.paths.working_dir}/orders', 
-           n=1)
 
-## Customers
-copy_files(copy_from='/Volumes/dbacademy_retail/v01/retail-pipeline/status/stream_json', 
-           copy_to=f'{DA.paths.working_dir}/status', 
-           n=1)
+run_setup_step(step_name = 'reset_landing_folders',
+               inputs = {'source_volume': source_volume, 'working_dir': DA.paths.working_dir, 'landing_folders': landing_folders, 'n': 1},
+               step_func = reset_landing_folders,
+               state_dir = DA.paths.working_dir,
+               output_fingerprint = lambda: _folder_fingerprint([f'{DA.paths.working_dir}/{folder}' for folder in landing_folders]),
+               force = force_setup_reset)
 
 
 
@@ -3,26 +3,160 @@
 
 # COMMAND ----------
 
+# MAGIC %run ./Schema-Registry
+
+# COMMAND ----------
+
+# MAGIC %run ./Rule-Engine
+
+# COMMAND ----------
+
 DA = DBAcademyHelper()
 DA.init()
 
 # COMMAND ----------
 
-# MAGIC %sql
-# MAGIC -- CREATE DA VARIABLE USING SQL FOR USER INFORMATION FROM THE META TABLE
-# MAGIC
-# MAGIC -- Create a temp view storing information from the obs table.
-# MAGIC CREATE OR REPLACE TEMP VIEW user_info AS
-# MAGIC SELECT map_from_arrays(collect_list(replace(key,'.','_')), collect_list(value))
-# MAGIC FROM dbacademy.ops.meta;
-# MAGIC
-# MAGIC -- Create SQL dictionary var (map)
-# MAGIC DECLARE OR REPLACE DA MAP<STRING,STRING>;
-# MAGIC
-# MAGIC -- Set the temp view in the DA variable
-# MAGIC SET VAR DA = (SELECT * FROM user_info);
-# MAGIC
-# MAGIC DROP VIEW IF EXISTS user_info;
+## CREATE DA VARIABLE FOR USER INFORMATION FROM THE META TABLE
+##
+## dbacademy.ops.meta is read once per session and cached in _da_meta, which survives the %run chains of the lesson setups.
+## The SQL DA MAP<STRING,STRING> variable is set from the cached values, so repeated %run calls skip the metastore query.
+
+if '_da_meta' not in globals():
+    _da_meta = None
+
+
+def get_da_meta(key: str = None, default: str = None, refresh: bool = False):
+    '''
+    Returns the user information from the dbacademy.ops.meta table, with '.' in the keys replaced by '_', the same keys as the SQL DA variable.
+
+    The meta table is queried on the first call of the session, or when refresh is True, and the SQL DA variable is set from it.
+
+    Parameters:
+    - key (str, optional): Return only the value of this key. Default is None, which returns the whole dictionary.
+    - default (str, optional): The value returned if the key does not exist. Default is None.
+    - refresh (bool, optional): Query the meta table again. Default is False.
+
+    Example:
+    - get_da_meta('username')
+    '''
+    global _da_meta
+
+    if _da_meta is None or refresh:
+        rows = spark.sql("SELECT replace(key, '.', '_') AS key, value FROM dbacademy.ops.meta").collect()
+        _da_meta = {row.key: row.value for row in rows}
+
+        ## Create SQL dictionary var (map) from the cached values
+        spark.sql("DECLARE OR REPLACE VARIABLE DA MAP<STRING,STRING>")
+        spark.sql("SET VAR DA = map_from_arrays(:keys, :values)", args = {'keys': list(_da_meta.keys()), 'values': list(_da_meta.values())})
+
+    if key is None:
+        return _da_meta
+    return _da_meta.get(key, default)
+
+
+get_da_meta()
+
+# COMMAND ----------
+
+import threading
+import time
+
+class CatalogMetadataCache:
+    """
+    In-process cache of catalog metadata (catalogs, schemas, tables and volumes) shared by the setup helpers.
+
+    - Each kind of metadata is loaded with a single query and kept for `ttl_seconds`.
+    - Tables and volumes are loaded for a whole catalog at once from its information_schema, so checking several schemas costs one query.
+    - Helpers that run DDL call `invalidate` so the next lookup reloads the changed metadata.
+    - Objects created outside the helpers (e.g. by a pipeline run) are not seen until the entry expires, so helpers that act on the
+      current catalog state (drop_tables and the schema checks) pass refresh=True to reload the entry once before reading it.
+    - `round_trips` counts the metadata queries issued.
+
+    Example:
+      catalog_metadata_cache.schemas('dbacademy_peter')
+      catalog_metadata_cache.invalidate(catalog='dbacademy_peter', kind='schemas')
+    """
+
+    def __init__(self, ttl_seconds: int = 300):
+        self.ttl_seconds = ttl_seconds
+        self.round_trips = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: tuple, loader: callable, refresh: bool = False):
+        with self._lock:
+            entry = self._entries.get(key)
+            if not refresh and entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+                return entry[1]
+
+        value = loader()
+        with self._lock:
+            self.round_trips = self.round_trips + 1
+            self._entries[key] = (time.monotonic(), value)
+        return value
+
+    def catalogs(self, refresh: bool = False) -> set:
+        return self._get(('catalogs',), lambda: {row.catalog for row in spark.sql('SHOW CATALOGS').collect()}, refresh)
+
+    def schemas(self, catalog: str, refresh: bool = False) -> set:
+        return self._get(('schemas', catalog), lambda: {row.databaseName for row in spark.sql(f'SHOW SCHEMAS IN {catalog}').collect()}, refresh)
+
+    def tables(self, catalog: str, schema: str, refresh: bool = False) -> dict:
+        '''
+        Returns a dictionary of table name -> table type (MANAGED, EXTERNAL, VIEW, MATERIALIZED_VIEW, STREAMING_TABLE, ...) in the schema.
+        With refresh=True the tables of the whole catalog are reloaded first.
+        '''
+        def load_tables():
+            tables = {}
+            for row in spark.sql(f'SELECT table_schema, table_name, table_type FROM {catalog}.information_schema.tables').collect():
+                tables.setdefault(row.table_schema, {})[row.table_name] = row.table_type
+            return tables
+
+        return self._get(('tables', catalog), load_tables, refresh).get(schema, {})
+
+    def volumes(self, catalog: str, schema: str) -> set:
+        def load_volumes():
+            volumes = {}
+            for row in spark.sql(f'SELECT volume_schema, volume_name FROM {catalog}.information_schema.volumes').collect():
+                volumes.setdefault(row.volume_schema, set()).add(row.volume_name)
+            return volumes
+
+        return self._get(('volumes', catalog), load_volumes).get(schema, set())
+
+    def volume_path(self, catalog: str, schema: str, volume: str) -> dict:
+        '''
+        Returns whether the catalog, schema and volume exist as {'catalog': bool, 'schema': bool, 'volume': bool}, resolved in one
+        query against system.information_schema.
+        '''
+        def load_volume_path():
+            row = spark.sql("""
+                SELECT
+                  (SELECT count(*) FROM system.information_schema.catalogs WHERE catalog_name = :catalog) > 0 AS catalog_exists,
+                  (SELECT count(*) FROM system.information_schema.schemata WHERE catalog_name = :catalog AND schema_name = :schema) > 0 AS schema_exists,
+                  (SELECT count(*) FROM system.information_schema.volumes WHERE volume_catalog = :catalog AND volume_schema = :schema AND volume_name = :volume) > 0 AS volume_exists
+            """, args = {'catalog': catalog, 'schema': schema, 'volume': volume}).collect()[0]
+            return {'catalog': row.catalog_exists, 'schema': row.schema_exists, 'volume': row.volume_exists}
+
+        return self._get(('volume_path', catalog, schema, volume), load_volume_path)
+
+    def invalidate(self, catalog: str = None, kind: str = None):
+        '''
+        Removes cached metadata. With no arguments clears everything, otherwise only the entries for the catalog and/or kind
+        ('catalogs', 'schemas', 'tables' or 'volumes'). Cached volume paths are cleared with every kind except 'tables'.
+        '''
+        with self._lock:
+            for key in list(self._entries):
+                kind_matches = kind is None or key[0] == kind or (key[0] == 'volume_path' and kind != 'tables')
+                if kind_matches and (catalog is None or key[0] == 'catalogs' or key[1] == catalog):
+                    del self._entries[key]
+
+    def __str__(self):
+        return f"CatalogMetadataCache(ttl_seconds={self.ttl_seconds}, entries={len(self._entries)}, round_trips={self.round_trips})"
+
+
+## Keep the cache across %run chains in the same session
+if 'catalog_metadata_cache' not in globals():
+    catalog_metadata_cache = CatalogMetadataCache()
 
 # COMMAND ----------
 
@@ -32,6 +166,7 @@ def create_volume(in_catalog: str, in_schema: str, volume_name: str):
     '''
     print(f'Creating volume: {in_catalog}.{in_schema}.{volume_name} if not exists.\n')
     r = spark.sql(f'CREATE VOLUME IF NOT EXISTS {in_catalog}.{in_schema}.{volume_name}')
+    catalog_metadata_cache.invalidate(catalog = in_catalog, kind = 'volumes')
 
 # COMMAND ----------
 
@@ -56,14 +191,15 @@ def create_schemas(in_catalog: str, schema_names: list):
     - create_schemas(in_catalog = DA.catalog_name, schema_names = ['1_bronze', '2_silver', '3_gold'])
     '''
 
-    ## Current schemas in catalog
-    list_of_curr_schemas = spark.sql(f'SHOW SCHEMAS IN {in_catalog}').toPandas().databaseName.to_list()
+    ## Current schemas in catalog, reloaded since schemas can be created or dropped outside the helpers
+    list_of_curr_schemas = catalog_metadata_cache.schemas(in_catalog, refresh = True)
 
     # Create schema in catalog if not exists
     for schema in schema_names:
         if schema not in list_of_curr_schemas:
             print(f'Creating schema: {in_catalog}.{schema}.')
             spark.sql(f'CREATE SCHEMA IF NOT EXISTS {in_catalog}.{schema}')
+            catalog_metadata_cache.invalidate(catalog = in_catalog, kind = 'schemas')
         else:
             print(f'Schema {in_catalog}.{schema} already exists. No action taken.')
 
@@ -84,8 +220,8 @@ def check_if_schemas_are_created(in_catalog: str, check_schemas: list[str]):
     - check_if_schemas_are_created(in_catalog='mycatalog', check_schemas=['bronze', 'silver', 'gold'])
     '''
 
-    ## Current schemas in catalog
-    list_of_curr_schemas = set(spark.sql(f'SHOW SCHEMAS IN {in_catalog}').toPandas().databaseName.to_list())
+    ## Current schemas in catalog, reloaded since schemas can be created or dropped outside the helpers
+    list_of_curr_schemas = catalog_metadata_cache.schemas(in_catalog, refresh = True)
 
     # Convert check_catalogs list to a set
     check_schemas_set = set(check_schemas)
@@ -105,27 +241,63 @@ def check_if_schemas_are_created(in_catalog: str, check_schemas: list[str]):
 
 # COMMAND ----------
 
-def delete_source_files(source_files: str):
+def _list_files_with_sizes(directory: str) -> list:
+    '''
+    Recursively lists the files under a directory as (path, size in bytes) tuples using a single os.scandir pass per folder.
+    '''
+    import os
+
+    files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks = False):
+                files.extend(_list_files_with_sizes(entry.path))
+            else:
+                files.append((entry.path, entry.stat(follow_symlinks = False).st_size))
+    return files
+
+
+def delete_source_files(source_files: str, mode: str = 'sequential', max_workers: int = 16, dry_run: bool = False, file_index = None) -> dict:
     """
     Deletes all files in the specified source volume.
 
-    This function iterates through all the files in the given volume,
-    deletes them, and prints the name of each file being deleted.
+    Modes:
+    - 'sequential': Deletes each entry in the folder one at a time and prints the name of each file being deleted.
+    - 'parallel': Deletes the entries in the folder on a thread pool of `max_workers` threads. The folder itself is kept.
+    - 'bulk': Removes the folder and everything in it with a single recursive delete. The folder itself is removed.
 
     Parameters:
     - source_files : str
-        The path to the volume containing the files to delete. 
+        The path to the volume containing the files to delete. The path can end with or without a slash.
         Use the {DA.paths.working_dir} to dynamically navigate to the user's volume location in dbacademy/ops/vocareumlab@name:
             Example: DA.paths.working_dir = /Volumes/dbacademy/ops/vocareumlab@name
+    - mode : str, optional
+        'sequential', 'parallel' or 'bulk'. Default is 'sequential'.
+    - max_workers : int, optional
+        The number of threads used in 'parallel' mode. Default is 16.
+    - dry_run : bool, optional
+        If True, only counts what would be deleted without deleting anything. Default is False.
+    - file_index : VolumeFileIndex, optional
+        An index of source_files or one of its parent folders. The files and bytes to delete are counted from the index instead of
+        stat'ing every file, and the deleted folder is removed from the index.
+        Call file_index.save() to persist the updated index. Default is None.
 
     Returns:
-    - None. This function does not return any value. It performs file deletion and prints all files that it deletes. If no files are found it prints in the output.
+    - dict: Summary with the number of files and bytes deleted (or that would be deleted in dry-run mode) and the elapsed seconds.
 
     Example:
     - delete_source_files(f'{DA.paths.working_dir}/pii/stream_source/user_reg')
+    - delete_source_files(f'{DA.paths.working_dir}/orders', mode='parallel')
     """
 
     import os
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    if mode not in ('sequential', 'parallel', 'bulk'):
+        raise ValueError(f"mode must be 'sequential', 'parallel' or 'bulk', got '{mode}'.")
+
+    start_time = time.perf_counter()
 
     print(f'\nSearching for files in {source_files} volume to delete prior to creating files...')
     if os.path.exists(source_files):
@@ -133,127 +305,1312 @@ def delete_source_files(source_files: str):
     else:
         list_of_files = None
 
+    summary = {'path': source_files, 'mode': mode, 'dry_run': dry_run, 'files': 0, 'bytes': 0, 'seconds': 0.0}
+
     if not list_of_files:  # Checks if the list is empty.
         print(f"No files found in {source_files}.\n")
+        summary['seconds'] = time.perf_counter() - start_time
+        return summary
+
+    ## Count the files and bytes to delete, from the index if there is one
+    if file_index is not None:
+        file_index.refresh(folder = source_files)
+        files_with_sizes = [(path, size) for path, size, _, _ in file_index.files(file_index.relative_path(source_files), recursive = True)]
     else:
-        for file in list_of_files:
-            file_to_delete = source_files + file
+        files_with_sizes = _list_files_with_sizes(source_files)
+    summary['files'] = len(files_with_sizes)
+    summary['bytes'] = sum(size for _, size in files_with_sizes)
+
+    paths_to_delete = [os.path.join(source_files, file) for file in list_of_files]
+
+    if dry_run:
+        print(f"Would delete {summary['files']} file(s), {summary['bytes']} bytes in {source_files} using '{mode}' mode.")
+    elif mode == 'sequential':
+        for file_to_delete in paths_to_delete:
             print(f'Deleting file: {file_to_delete}')
-            dbutils.fs.rm(file_to_delete)
+            dbutils.fs.rm(file_to_delete, True)
+    elif mode == 'parallel':
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            list(executor.map(lambda file_to_delete: dbutils.fs.rm(file_to_delete, True), paths_to_delete))
+    else:
+        dbutils.fs.rm(source_files, True)
+
+    if file_index is not None and not dry_run:
+        file_index.forget(source_files)
+
+    summary['seconds'] = time.perf_counter() - start_time
+    if not dry_run:
+        print(f"Deleted {summary['files']} file(s), {summary['bytes']} bytes from {source_files} in {summary['seconds']:.2f}s using '{mode}' mode.")
+    return summary
 
 # COMMAND ----------
 
-def copy_files(copy_from: str, copy_to: str, n: int, sleep=2):
+import errno
+
+## ioctl request number of FICLONE on Linux, used to create a copy-on-write clone (reflink) of a file
+_FICLONE = 0x40049409
+
+## Zero-copy methods that are not supported per (source folder, target folder), so they are not retried for every file
+_zero_copy_unsupported = {}
+
+## errno values that mean a reflink or hardlink is not supported between two folders, as opposed to a failure for one file.
+## FICLONE returns ENOTTY on filesystems without the ioctl.
+_ZERO_COPY_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOTTY}
+
+
+def _zero_copy_file(file_to_copy: str, copy_file_to: str):
+    '''
+    Tries to create the target without copying any bytes, first as a reflink (copy-on-write clone) and then as a hardlink.
+
+    This only works when the source and target are local or FUSE paths on the same filesystem that supports it. The link is created
+    under a hidden temporary name ('.<name>.zero-copy-tmp', ignored by Auto Loader and read_files) and renamed over the target, so an
+    existing target is replaced in a single step. A target that is already a hardlink of the source is left as is.
+
+    A hardlinked target is the same file as the source, so writing to the target also changes the source. Only use it for immutable
+    source files whose staged copies are never modified in place.
+
+    A method is only remembered as unsupported for the folder pair when it fails with an errno in _ZERO_COPY_UNSUPPORTED_ERRNOS.
+
+    Returns 'reflink' or 'hardlink' on success, or None if the file has to be copied.
+    '''
+    import os
+
+    if not (file_to_copy.startswith('/') and copy_file_to.startswith('/')) or not os.path.isfile(file_to_copy):
+        return None
+
+    temp_file = os.path.join(os.path.dirname(copy_file_to), '.' + os.path.basename(copy_file_to) + '.zero-copy-tmp')
+    unsupported = _zero_copy_unsupported.setdefault((os.path.dirname(file_to_copy), os.path.dirname(copy_file_to)), set())
+
+    def remove_temp_file():
+        if os.path.lexists(temp_file):
+            os.remove(temp_file)
+
+    ## Remove a temporary file left by an earlier copy, which would make os.link fail with EEXIST
+    remove_temp_file()
+
+    ## Renaming a link over another link to the same file does nothing, so there is nothing to do
+    if os.path.exists(copy_file_to) and os.path.samefile(file_to_copy, copy_file_to):
+        return 'hardlink'
+
+    if 'reflink' not in unsupported:
+        try:
+            import fcntl
+            with open(file_to_copy, 'rb') as source, open(temp_file, 'wb') as target:
+                fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+            os.replace(temp_file, copy_file_to)
+            return 'reflink'
+        except ImportError:
+            unsupported.add('reflink')
+        except OSError as e:
+            if e.errno in _ZERO_COPY_UNSUPPORTED_ERRNOS:
+                unsupported.add('reflink')
+        finally:
+            remove_temp_file()
+
+    if 'hardlink' not in unsupported:
+        try:
+            os.link(file_to_copy, temp_file)
+            os.replace(temp_file, copy_file_to)
+            return 'hardlink'
+        except OSError as e:
+            if e.errno in _ZERO_COPY_UNSUPPORTED_ERRNOS:
+                unsupported.add('hardlink')
+        finally:
+            remove_temp_file()
+
+    return None
+
+
+_PARTIAL_SUFFIX = '.partial'
+
+## Suffix of the hidden resume log kept next to a chunked copy's partial file
+_RESUME_SUFFIX = '.resume' + _PARTIAL_SUFFIX
+
+
+def _print_copy_progress(file_to_copy: str):
+    '''
+    Returns a progress callback that prints the progress of a chunked copy every 10%.
+    '''
+    last_printed = {'percent': -10}
+
+    def progress(bytes_copied: int, total_bytes: int):
+        percent = 100 if total_bytes == 0 else int(bytes_copied * 100 / total_bytes)
+        if percent >= last_printed['percent'] + 10 or bytes_copied == total_bytes:
+            last_printed['percent'] = percent
+            print(f'    {file_to_copy}: {bytes_copied}/{total_bytes} bytes ({percent}%)')
+
+    return progress
+
+
+def _verified_checkpoints(partial_file: str, resume_file: str, source_id: dict) -> list:
+    '''
+    Returns the checkpoints of a partial file that can be resumed: the (offset, sha256) entries of its resume log whose chunks still
+    match the partial file, up to the first chunk that does not match.
+
+    Returns an empty list, so the copy restarts from zero, if the partial file or its resume log is missing or the resume log was
+    started for another source, size or modification time.
+    '''
+    import os
+    import json
+    import hashlib
+
+    if not (os.path.exists(partial_file) and os.path.exists(resume_file)):
+        return []
+
+    checkpoints = []
+    with open(resume_file) as f:
+        try:
+            if json.loads(f.readline() or '{}') != source_id:
+                return []
+            for line in f:
+                checkpoints.append(json.loads(line))
+        except ValueError:
+            ## The last line was cut off by an interrupted copy
+            pass
+
+    verified = []
+    start = 0
+    with open(partial_file, 'rb') as partial:
+        for checkpoint in checkpoints:
+            chunk = partial.read(checkpoint['offset'] - start)
+            if len(chunk) != checkpoint['offset'] - start or hashlib.sha256(chunk).hexdigest() != checkpoint['sha256']:
+                break
+            verified.append(checkpoint)
+            start = checkpoint['offset']
+    return verified
+
+
+def _chunked_copy_file(file_to_copy: str, copy_file_to: str, buffer_size: int = 8 * 1024 * 1024, progress_callback: callable = None) -> int:
+    '''
+    Copies a file in chunks of buffer_size bytes to a hidden '.<name>.partial' file next to the target and renames it to the target
+    when complete, so readers never see a half written file. Auto Loader and read_files ignore hidden files.
+
+    A hidden '.<name>.resume.partial' log records the source path, size and modification time when the partial file is started,
+    and the SHA-256 of each chunk as it is written. If a copy is interrupted, the next copy checks the log against the source and
+    the partial file. It resumes after the last chunk that still matches, or restarts from zero if the source changed or the log
+    is missing.
+
+    progress_callback(bytes_copied, total_bytes) is called after each chunk.
+
+    Returns the offset the copy resumed from.
+    '''
+    import os
+    import json
+    import hashlib
+
+    partial_file = os.path.join(os.path.dirname(copy_file_to), '.' + os.path.basename(copy_file_to) + _PARTIAL_SUFFIX)
+    resume_file = os.path.join(os.path.dirname(copy_file_to), '.' + os.path.basename(copy_file_to) + _RESUME_SUFFIX)
+    source_stat = os.stat(file_to_copy)
+    total_bytes = source_stat.st_size
+    source_id = {'source': file_to_copy, 'size': total_bytes, 'mtime_ns': source_stat.st_mtime_ns}
+
+    ## Keep only the verified chunks of an existing partial file and rewrite the resume log to match
+    checkpoints = _verified_checkpoints(partial_file, resume_file, source_id)
+    offset = checkpoints[-1]['offset'] if checkpoints else 0
+    with open(resume_file, 'w') as resume_log:
+        resume_log.writelines(json.dumps(entry) + '\n' for entry in [source_id] + checkpoints)
+
+    resumed_from = offset
+    with open(file_to_copy, 'rb') as source, open(partial_file, 'r+b' if offset else 'wb') as target, open(resume_file, 'a') as resume_log:
+        source.seek(offset)
+        target.seek(offset)
+        target.truncate()
+        for chunk in iter(lambda: source.read(buffer_size), b''):
+            target.write(chunk)
+            target.flush()
+            offset = offset + len(chunk)
+
+            ## Record the chunk only after it is written, so a checkpoint never points past the data in the partial file
+            resume_log.write(json.dumps({'offset': offset, 'sha256': hashlib.sha256(chunk).hexdigest()}) + '\n')
+            resume_log.flush()
+            if progress_callback:
+                progress_callback(offset, total_bytes)
+        os.fsync(target.fileno())
+
+    os.replace(partial_file, copy_file_to)
+    os.remove(resume_file)
+    return resumed_from
+
+
+## File extension added to the target file for each supported staging compression
+_COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def _open_compressed(file_path: str, mode: str, compression: str):
+    '''
+    Opens a gzip or zstd compressed file as a stream for reading ('rb') or writing ('wb').
+    zstd requires the optional zstandard package.
+    '''
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(file_path, mode, compresslevel = 6)
+
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("compression='zstd' requires the zstandard package. Install it with %pip install zstandard or use compression='gzip'.")
+
+    if mode == 'rb':
+        return zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'), closefd = True)
+    return zstandard.ZstdCompressor(level = 3).stream_writer(open(file_path, 'wb'), closefd = True)
+
+
+def _compress_file(file_to_copy: str, copy_file_to: str, compression: str, buffer_size: int = 8 * 1024 * 1024) -> int:
+    '''
+    Streams a file through gzip or zstd compression into a hidden partial file next to the target and renames it to the target
+    when complete. The file is never fully loaded in memory.
+
+    Returns the number of compressed bytes written.
+    '''
+    import os
+    import shutil
+
+    partial_file = os.path.join(os.path.dirname(copy_file_to), '.' + os.path.basename(copy_file_to) + _PARTIAL_SUFFIX)
+    with open(file_to_copy, 'rb') as source, _open_compressed(partial_file, 'wb', compression) as target:
+        shutil.copyfileobj(source, target, buffer_size)
+
+    os.replace(partial_file, copy_file_to)
+    return os.path.getsize(copy_file_to)
+
+
+def _copy_single_file(file_to_copy: str,
+                      copy_file_to: str,
+                      zero_copy: bool = False,
+                      chunked: bool = False,
+                      buffer_size: int = 8 * 1024 * 1024,
+                      progress_callback: callable = None,
+                      compression: str = None) -> dict:
+    '''
+    Copies a single file and returns the number of bytes read and written, the elapsed copy time and the method used.
+
+    If compression is 'gzip' or 'zstd' the file is written compressed to copy_file_to. Otherwise, if zero_copy is True a reflink
+    or hardlink is tried first. If chunked is True and the paths are local or FUSE paths, the file is copied with a resumable
+    chunked copy. Otherwise the file is copied with dbutils.fs.cp.
+    '''
+    import os
+    import time
+
+    start_time = time.perf_counter()
+    bytes_written = None
+    method = None
+    if compression:
+        bytes_written = _compress_file(file_to_copy, copy_file_to, compression, buffer_size)
+        method = compression
+    if method is None and zero_copy:
+        method = _zero_copy_file(file_to_copy, copy_file_to)
+    if method is None and chunked and file_to_copy.startswith('/') and copy_file_to.startswith('/') and os.path.isfile(file_to_copy):
+        resumed_from = _chunked_copy_file(file_to_copy, copy_file_to, buffer_size, progress_callback or _print_copy_progress(file_to_copy))
+        method = f'chunked, resumed at {resumed_from}' if resumed_from else 'chunked'
+    if method is None:
+        dbutils.fs.cp(file_to_copy, copy_file_to, recurse = True)
+        method = 'copy'
+    elapsed = time.perf_counter() - start_time
+
+    file_size = os.path.getsize(file_to_copy) if os.path.isfile(file_to_copy) else 0
+    return {'file': file_to_copy, 'bytes': file_size, 'bytes_written': file_size if bytes_written is None else bytes_written, 'seconds': elapsed, 'method': method}
+
+
+def _format_throughput(n_files: int, n_bytes: int, seconds: float) -> str:
+    '''
+    Formats copy throughput as files/s and MB/s.
+    '''
+    seconds = max(seconds, 1e-9)
+    return f'{n_files / seconds:.2f} files/s, {n_bytes / seconds / (1024 * 1024):.2f} MB/s'
+
+
+def _file_checksum(file_path: str, chunk_size: int = 8 * 1024 * 1024, compression: str = None) -> str:
+    '''
+    Returns the SHA-256 checksum of a file, reading it in chunks so large files are never fully loaded in memory.
+    If compression is set, the checksum is computed over the decompressed content.
+    '''
+    import hashlib
+
+    checksum = hashlib.sha256()
+    with (_open_compressed(file_path, 'rb', compression) if compression else open(file_path, 'rb')) as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def _target_is_current(file_to_copy: str, copy_file_to: str, skip_mode: str, compression: str = None) -> bool:
+    '''
+    Checks if an existing target file is an up to date copy of the source file.
+
+    - 'name': The target exists.
+    - 'fingerprint': The target has the same size as the source and was modified at or after the source.
+    - 'checksum': The target has the same size and the same SHA-256 checksum as the source.
+
+    For compressed targets the size is not compared, and the checksum is computed over the decompressed target.
+    '''
+    import os
+
+    if skip_mode == 'name':
+        return True
+
+    source_stat = os.stat(file_to_copy)
+    target_stat = os.stat(copy_file_to)
+    if not compression and source_stat.st_size != target_stat.st_size:
+        return False
+
+    if skip_mode == 'fingerprint':
+        return target_stat.st_mtime >= source_stat.st_mtime
+    return _file_checksum(file_to_copy) == _file_checksum(copy_file_to, compression = compression)
+
+
+def copy_files(copy_from: str,
+               copy_to: str,
+               n: int,
+               sleep=2,
+               mode: str = 'simulate',
+               max_workers: int = 8,
+               skip_mode: str = 'name',
+               zero_copy: bool = False,
+               chunked: bool = False,
+               buffer_size: int = 8 * 1024 * 1024,
+               progress_callback: callable = None,
+               compression: str = None,
+               file_index = None) -> dict:
     '''
     Copy files from one location to another destination's volume.
 
     This method performs the following tasks:
       1. Lists files in the source directory and sorts them. Sorted to keep them in the same order when copying for consistency.
       2. Verifies that the source directory has at least `n` files.
-      3. Copies files from the source to the destination, skipping files already present at the destination.
-      4. Pauses for `sleep` seconds after copying each file.
-      5. Stops after copying `n` files or if all files are processed.
-      6. Will print information on the files copied.
+      3. Copies the first `n` files from the source to the destination, skipping files already present at the destination.
+         With `skip_mode` set to 'fingerprint' or 'checksum', files already at the destination are re-copied if they differ from the source.
+      4. In 'simulate' mode pauses for `sleep` seconds after copying each file to simulate files arriving over time.
+         In 'fast' mode copies the files in parallel on a thread pool of `max_workers` threads without pausing.
+      5. Will print information on the files copied with the per-file and total throughput.
+      6. Stops on the first failed copy. In 'fast' mode any copies that have not started yet are cancelled and the error is raised.
     
     Parameters
     - copy_from (str): The source directory where files are to be copied from.
     - copy_to (str): The destination directory where files will be copied to.
     - n (int): The number of files to copy from the source. If n is larger than total files, an error is returned.
-    - sleep (int, optional): The number of seconds to pause after copying each file. Default is 2 seconds.
+    - sleep (int, optional): The number of seconds to pause after copying each file in 'simulate' mode. Default is 2 seconds.
+    - mode (str, optional): 'simulate' to copy one file at a time and simulate arrival, or 'fast' to copy as fast as possible in parallel. Default is 'simulate'.
+    - max_workers (int, optional): The number of threads used to copy files in 'fast' mode. Default is 8.
+    - skip_mode (str, optional): How to decide that a file already at the destination can be skipped. Default is 'name'.
+        - 'name': Skip if a file with the same name exists.
+        - 'fingerprint': Skip if the file has the same size and is not older than the source.
+        - 'checksum': Skip if the file has the same size and SHA-256 checksum as the source.
+    - zero_copy (bool, optional): If True, tries to reflink or hardlink each file before falling back to a byte copy.
+                                  This only applies when the source and destination are on the same filesystem. A hardlinked copy
+                                  shares its data with the source, so only use it for immutable sources that are never modified in
+                                  the destination. Default is False.
+    - chunked (bool, optional): If True, copies each file in chunks of `buffer_size` bytes to a hidden partial file that is renamed when complete.
+                                An interrupted copy resumes from the partial file on the next run. Default is False.
+    - buffer_size (int, optional): Chunk size in bytes for chunked copies. Default is 8 MB.
+    - progress_callback (callable, optional): Function called as progress_callback(bytes_copied, total_bytes) after each chunk.
+                                              Default is None, which prints the progress every 10%.
+    - compression (str, optional): 'gzip' or 'zstd' to stage compressed copies named <file>.gz or <file>.zst. The compression is streamed,
+                                   so files are never fully loaded in memory. zstd requires the zstandard package. Default is None.
+    - file_index (VolumeFileIndex, optional): An index of the destination or one of its parent folders. The files already at the destination
+                                              are read from the index and the copied files are recorded in it.
+                                              Call file_index.save() to persist the updated index. Default is None.
 
     Returns:
-    - None: Prints information to the log on what files it's loading. If the file exists, it skips that file.
+    - dict: Summary of the copy with the number of files copied and skipped, total bytes, elapsed seconds, files/s and MB/s.
 
     Example:
     - copy_files(copy_from='/Volumes/gym_data/v01/user-reg', 
            copy_to=f'{DA.paths.working_dir}/pii/stream_source/user_reg',
            n=1)
+    - copy_files(copy_from='/Volumes/gym_data/v01/user-reg', 
+           copy_to=f'{DA.paths.working_dir}/pii/stream_source/user_reg',
+           n=1000, mode='fast', max_workers=16)
     '''
     import os
     import time
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    if mode not in ('simulate', 'fast'):
+        raise ValueError(f"mode must be 'simulate' or 'fast', got '{mode}'.")
+    if max_workers < 1:
+        raise ValueError(f'max_workers must be at least 1, got {max_workers}.')
+    if skip_mode not in ('name', 'fingerprint', 'checksum'):
+        raise ValueError(f"skip_mode must be 'name', 'fingerprint' or 'checksum', got '{skip_mode}'.")
+    if compression is not None and compression not in _COMPRESSION_EXTENSIONS:
+        raise ValueError(f"compression must be None, 'gzip' or 'zstd', got '{compression}'.")
 
     print(f"\n----------------Loading files to user's volume: '{copy_to}'----------------")
 
     ## List all files in the copy_from volume and sort the list
-    list_of_files_to_copy = sorted(os.listdir(copy_from))
+    list_of_files_to_copy = sorted(file for file in os.listdir(copy_from) if not file.endswith(_PARTIAL_SUFFIX))
     total_files_in_copy_location = len(list_of_files_to_copy)
 
-    ## Get a list of files in the source
-    list_of_files_in_source = os.listdir(copy_to)
+    ## Get a list of files in the source, from the index if there is one
+    if file_index is not None:
+        file_index.refresh(folder = copy_to)
+        list_of_files_in_source = {os.path.basename(path) for path, _, _, _ in file_index.files(file_index.relative_path(copy_to))}
+    else:
+        list_of_files_in_source = set(os.listdir(copy_to))
 
     assert total_files_in_copy_location >= n, f"The source location contains only {total_files_in_copy_location} files, but you specified {n}  files to copy. Please specify a number less than or equal to the total number of files available."
 
-    ## Looping counter
-    counter = 1
+    ## Split the first n files into files to skip and files to copy, keeping the file number for the log
+    files_to_copy = []
+    skipped = 0
+    for counter, file in enumerate(list_of_files_to_copy[:n], start = 1):
 
-    ## Load files if not found in the co
-    for file in list_of_files_to_copy:
+      target_file = file + _COMPRESSION_EXTENSIONS.get(compression, '')
+      file_to_copy = f'{copy_from}/{file}'
+      copy_file_to = f'{copy_to}/{target_file}'
 
-      ## If the file is found in the source, skip it with a note. Otherwise, copy file.
-      if file in list_of_files_in_source:
-        print(f'File number {counter} - {file} is already in the source volume "{copy_to}". Skipping file.')
+      ## If the file is found in the source and is current, skip it with a note. Otherwise, copy file.
+      if target_file in list_of_files_in_source and _target_is_current(file_to_copy, copy_file_to, skip_mode, compression):
+        print(f'File number {counter} - {target_file} is already in the source volume "{copy_to}". Skipping file.')
+        skipped = skipped + 1
       else:
-        file_to_copy = f'{copy_from}/{file}'
-        copy_file_to = f'{copy_to}/{file}'
+        if target_file in list_of_files_in_source:
+          print(f'File number {counter} - {file} in the source volume "{copy_to}" differs from {file_to_copy}. Re-copying file.')
+        files_to_copy.append((counter, file_to_copy, copy_file_to))
+
+    copied = 0
+    copied_bytes = 0
+    written_bytes = 0
+    start_time = time.perf_counter()
+
+    if mode == 'simulate':
+      for counter, file_to_copy, copy_file_to in files_to_copy:
         print(f'File number {counter} - Copying file {file_to_copy} --> {copy_file_to}.')
-        dbutils.fs.cp(file_to_copy, copy_file_to , recurse = True)
-        
+        result = _copy_single_file(file_to_copy, copy_file_to, zero_copy, chunked, buffer_size, progress_callback, compression)
+        copied = copied + 1
+        copied_bytes = copied_bytes + result['bytes']
+        written_bytes = written_bytes + result['bytes_written']
+        print(f"    Copied {result['bytes']} bytes ({result['method']}) in {result['seconds']:.2f}s ({_format_throughput(1, result['bytes'], result['seconds'])}).")
+
         ## Sleep after load
         time.sleep(sleep) 
 
-      ## Stop after n number of loops based on argument.
-      if counter == n:
-        break
-      else:
-        counter = counter + 1
+    else:
+      with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        ## Run each copy in a copy of the caller's context, so a running instrumentation span also counts the workers' file calls
+        futures = {executor.submit(contextvars.copy_context().run, _copy_single_file, file_to_copy, copy_file_to, zero_copy, chunked, buffer_size, progress_callback, compression): (counter, file_to_copy, copy_file_to)
+                   for counter, file_to_copy, copy_file_to in files_to_copy}
+        try:
+          for future in as_completed(futures):
+            counter, file_to_copy, copy_file_to = futures[future]
+            result = future.result()
+            copied = copied + 1
+            copied_bytes = copied_bytes + result['bytes']
+            written_bytes = written_bytes + result['bytes_written']
+            print(f"File number {counter} - Copied file {file_to_copy} --> {copy_file_to} ({result['method']}) in {result['seconds']:.2f}s ({_format_throughput(1, result['bytes'], result['seconds'])}).")
+        except Exception as e:
+          ## Stop on the first failure. Cancel copies that have not started and let running copies finish.
+          for pending in futures:
+            pending.cancel()
+          print(f'Copy failed for file number {counter} - {file_to_copy}: {e}. Cancelled remaining copies after {copied} file(s).')
+          raise
+
+    elapsed = time.perf_counter() - start_time
+    if file_index is not None and files_to_copy:
+      file_index.record([copy_file_to for _, _, copy_file_to in files_to_copy])
+    if copied:
+      print(f'Copied {copied} file(s), {copied_bytes} bytes in {elapsed:.2f}s ({_format_throughput(copied, copied_bytes, elapsed)}).')
+      if compression:
+        print(f'Wrote {written_bytes} {compression} compressed bytes ({written_bytes / max(copied_bytes, 1):.1%} of the source bytes).')
+
+    return {
+        'copied': copied,
+        'skipped': skipped,
+        'bytes': copied_bytes,
+        'bytes_written': written_bytes,
+        'seconds': elapsed,
+        'files_per_sec': copied / max(elapsed, 1e-9),
+        'mb_per_sec': copied_bytes / max(elapsed, 1e-9) / (1024 * 1024)
+    }
+
+# COMMAND ----------
+
+## Append-only log of the files delivered to a target directory: a header line with the source, then one line per delivered file
+_COPY_MANIFEST_NAME = '.copy_manifest.jsonl'
+
+
+def _load_copy_manifest(copy_from: str, copy_to: str) -> set:
+    '''
+    Returns the set of file names already delivered from copy_from to copy_to.
+
+    The manifest is stored in the target directory as a hidden file, which Auto Loader and read_files ignore. It is checked against a
+    single listing of the target directory, so files removed from the target by any means are delivered again. Files found in the
+    target that are not in the manifest count as delivered. If the manifest is missing, belongs to another source or lists removed
+    files, it is rewritten once from the listing.
+    '''
+    import os
+    import json
+
+    manifest_path = f'{copy_to}/{_COPY_MANIFEST_NAME}'
+    in_target = set(os.listdir(copy_to)) - {_COPY_MANIFEST_NAME}
+
+    manifest_files = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            header = json.loads(f.readline() or '{}')
+            if header.get('source') == copy_from:
+                manifest_files = {json.loads(line)['file'] for line in f if line.strip()}
+
+    if manifest_files is None or not manifest_files <= in_target:
+        if manifest_files:
+            removed = manifest_files - in_target
+            print(f'{len(removed)} file(s) in the copy manifest of "{copy_to}" are no longer in the target and will be delivered again.')
+        _save_copy_manifest(copy_from, copy_to, in_target)
+    elif in_target - manifest_files:
+        _append_copy_manifest(copy_to, in_target - manifest_files)
+
+    return in_target
+
+
+def _save_copy_manifest(copy_from: str, copy_to: str, delivered: set):
+    '''
+    Writes the copy manifest for the source/target pair, replacing the previous manifest in a single rename.
+    '''
+    import os
+    import json
+
+    manifest_path = f'{copy_to}/{_COPY_MANIFEST_NAME}'
+    with open(f'{manifest_path}.tmp', 'w') as f:
+        f.write(json.dumps({'source': copy_from}) + '\n')
+        f.writelines(json.dumps({'file': file}) + '\n' for file in sorted(delivered))
+    os.replace(f'{manifest_path}.tmp', manifest_path)
+
+
+def _append_copy_manifest(copy_to: str, files):
+    '''
+    Appends delivered files to the copy manifest, so recording a delivery writes one line instead of the whole manifest.
+    '''
+    import json
+
+    with open(f'{copy_to}/{_COPY_MANIFEST_NAME}', 'a') as f:
+        f.writelines(json.dumps({'file': file}) + '\n' for file in sorted(files))
+
+# COMMAND ----------
+
+def _rate_at(rate_profile: list, elapsed: float) -> float:
+    '''
+    Returns the target rate at the elapsed time of a cycling rate profile of (duration_seconds, rate) phases.
+    '''
+    cycle_length = sum(duration for duration, _ in rate_profile)
+    position = elapsed % cycle_length if cycle_length > 0 else 0
+    for duration, rate in rate_profile:
+        if position < duration:
+            return rate
+        position = position - duration
+    return rate_profile[-1][1]
+
+
+def simulate_file_arrival(sources: dict,
+                          target_rate: float = 1.0,
+                          rate_unit: str = 'files',
+                          rate_profile: list = None,
+                          burst_size: int = 1,
+                          max_files: int = None,
+                          max_workers: int = 4,
+                          delivery_log_path: str = None) -> dict:
+    '''
+    Replays source files into target directories at a target arrival rate to load-test streaming ingestion.
+
+    Each source is scheduled independently on its own clock, so every source receives files at the target rate at the same time.
+    Delivery times are computed from the start of the run instead of sleeping after each copy, and the copies are dispatched to a
+    thread pool, so the arrival rate does not depend on how long a single copy takes. Only files not already in the target are replayed,
+    in sorted order. With max_files, only the first max_files source files are considered, like copy_files with n, so a rerun with the
+    same max_files does not deliver more files.
+
+    Parameters:
+    - sources (dict): Mapping of source directory -> target directory, e.g. {f'{source}/orders/stream_json': f'{target}/orders'}.
+    - target_rate (float, optional): Target rate per source in files/sec or bytes/sec (see rate_unit). Default is 1 file per second.
+    - rate_unit (str, optional): 'files' or 'bytes'. Default is 'files'.
+    - rate_profile (list, optional): List of (duration_seconds, rate) phases that repeat for the whole run, used instead of target_rate
+                                     to simulate bursty traffic, e.g. [(30, 10), (60, 0.5)]. Default is None.
+    - burst_size (int, optional): Number of files released together. The rate is kept on average by waiting longer between bursts. Default is 1.
+    - max_files (int, optional): Makes sure the first max_files sorted files of each source are delivered. Default is None (all source files).
+    - max_workers (int, optional): Number of threads used to perform the copies. Default is 4.
+    - delivery_log_path (str, optional): If set, writes one JSON line per delivered file (source, file name, scheduled and delivered time, bytes)
+                                         to this path so ingestion latency can be measured by joining on the bronze source file name. Default is None.
+
+    Returns:
+    - dict: The delivery log and the actual delivered files/s and bytes/s per source and in total.
+
+    Example:
+    - simulate_file_arrival(sources={'/Volumes/dbacademy_retail/v01/retail-pipeline/orders/stream_json': f'{DA.paths.working_dir}/orders',
+                                     '/Volumes/dbacademy_retail/v01/retail-pipeline/status/stream_json': f'{DA.paths.working_dir}/status'},
+                            target_rate=2, max_files=50)
+    '''
+    import os
+    import time
+    import heapq
+    import json
+    import contextvars
+    from datetime import datetime, timezone
+    from concurrent.futures import ThreadPoolExecutor
+
+    if rate_unit not in ('files', 'bytes'):
+        raise ValueError(f"rate_unit must be 'files' or 'bytes', got '{rate_unit}'.")
+    if burst_size < 1:
+        raise ValueError(f'burst_size must be at least 1, got {burst_size}.')
+
+    rate_profile = rate_profile if rate_profile else [(1, target_rate)]
+    if all(rate <= 0 for _, rate in rate_profile):
+        raise ValueError('The rate profile must contain at least one phase with a rate greater than 0.')
+
+    ## List each source once and keep the first max_files files that have not been delivered yet
+    pending = {}
+    delivered_files = {}
+    for copy_from, copy_to in sources.items():
+        delivered_files[copy_from] = _load_copy_manifest(copy_from, copy_to)
+        files = sorted(os.listdir(copy_from))
+        if max_files is not None:
+            files = files[:max_files]
+        pending[copy_from] = [file for file in files if file not in delivered_files[copy_from]]
+
+    print(f"\n----------------Simulating file arrival for {len(sources)} source(s) at {rate_profile} {rate_unit}/sec----------------")
+
+    def _deliver(copy_from: str, file: str, scheduled: float, start_time: float) -> dict:
+        result = _copy_single_file(f'{copy_from}/{file}', f'{sources[copy_from]}/{file}')
+        delivered_at = time.perf_counter()
+        return {
+            'source': copy_from,
+            'file_name': file,
+            'bytes': result['bytes'],
+            'scheduled_offset_seconds': scheduled - start_time,
+            'delivered_offset_seconds': delivered_at - start_time,
+            'delivered_at': datetime.now(timezone.utc).isoformat()
+        }
+
+    ## Heap of (due time, source, index of the next file) so all sources are scheduled together
+    start_time = time.perf_counter()
+    schedule = [(start_time, copy_from, 0) for copy_from, files in pending.items() if files]
+    heapq.heapify(schedule)
+
+    futures = []
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        while schedule:
+            due, copy_from, index = heapq.heappop(schedule)
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+            ## Release the next burst for this source
+            files = pending[copy_from]
+            burst = files[index:index + burst_size]
+            burst_cost = 0
+            for file in burst:
+                futures.append(executor.submit(contextvars.copy_context().run, _deliver, copy_from, file, due, start_time))
+                burst_cost = burst_cost + (1 if rate_unit == 'files' else os.path.getsize(f'{copy_from}/{file}'))
+
+            ## Schedule the next burst, skipping phases with a rate of 0
+            next_due = due
+            rate = _rate_at(rate_profile, next_due - start_time)
+            while rate <= 0:
+                next_due = next_due + 0.1
+                rate = _rate_at(rate_profile, next_due - start_time)
+            next_due = next_due + burst_cost / rate
+
+            if index + burst_size < len(files):
+                heapq.heappush(schedule, (next_due, copy_from, index + burst_size))
+
+        deliveries = [future.result() for future in futures]
+
+    for copy_from, copy_to in sources.items():
+        _append_copy_manifest(copy_to, [d['file_name'] for d in deliveries if d['source'] == copy_from])
+
+    elapsed = time.perf_counter() - start_time
+
+    ## Summarize the delivered rate per source and in total
+    summary = {'sources': {}, 'deliveries': deliveries}
+    for copy_from in sources:
+        source_deliveries = [d for d in deliveries if d['source'] == copy_from]
+        source_bytes = sum(d['bytes'] for d in source_deliveries)
+        source_seconds = max([d['delivered_offset_seconds'] for d in source_deliveries], default = 0)
+        summary['sources'][copy_from] = {
+            'files': len(source_deliveries),
+            'bytes': source_bytes,
+            'files_per_sec': len(source_deliveries) / max(source_seconds, 1e-9),
+            'bytes_per_sec': source_bytes / max(source_seconds, 1e-9)
+        }
+        print(f"{copy_from} --> {sources[copy_from]}: delivered {len(source_deliveries)} file(s) ({_format_throughput(len(source_deliveries), source_bytes, source_seconds)}).")
+
+    total_bytes = sum(d['bytes'] for d in deliveries)
+    summary.update({
+        'files': len(deliveries),
+        'bytes': total_bytes,
+        'seconds': elapsed,
+        'files_per_sec': len(deliveries) / max(elapsed, 1e-9),
+        'bytes_per_sec': total_bytes / max(elapsed, 1e-9)
+    })
+    print(f'Delivered {len(deliveries)} file(s) in {elapsed:.2f}s ({_format_throughput(len(deliveries), total_bytes, elapsed)}).')
+
+    if delivery_log_path:
+        with open(delivery_log_path, 'w') as f:
+            for delivery in deliveries:
+                f.write(json.dumps(delivery) + '\n')
+        print(f'Delivery log written to {delivery_log_path}.')
+
+    return summary
 
 # COMMAND ----------
 
 def copy_file_for_multiple_sources(copy_n_files = 2, 
                                    sleep_set = 3,
                                    copy_from_source=str,
-                                   copy_to_target=str
+                                   copy_to_target=str,
+                                   target_rate: float = None,
+                                   rate_unit: str = 'files'
                                    ):
+    '''
+    Copies files for the orders, customers and status sources.
+
+    Makes sure the first `copy_n_files` sorted files of each source are in the target, so a rerun with the same `copy_n_files` copies nothing.
+    By default copies one more file per source on each of the `copy_n_files` iterations, sleeping `sleep_set` seconds after each copy.
+    Each source and target is listed once and the files already delivered are tracked in an append-only copy manifest in the target
+    directory, so staging N files takes N copies and N one-line appends instead of re-listing the directories on every iteration.
+    If `target_rate` is set, the files are instead replayed at that rate across all three sources at once with simulate_file_arrival.
 
+    Example:
+    - copy_file_for_multiple_sources(copy_n_files=5, copy_from_source='/Volumes/dbacademy_retail/v01/retail-pipeline', copy_to_target=DA.paths.working_dir, target_rate=0.5)
+    '''
+
+    if target_rate is not None:
+        return simulate_file_arrival(sources = {f'{copy_from_source}/{name}/stream_json': f'{copy_to_target}/{name}' for name in ['orders', 'customers', 'status']},
+                                     target_rate = target_rate,
+                                     rate_unit = rate_unit,
+                                     max_files = copy_n_files)
+
+    import os
+    import time
+
+    sources = {f'{copy_from_source}/{name}/stream_json': f'{copy_to_target}/{name}' for name in ['orders', 'customers', 'status']}
+
+    ## List and sort each source once and load the files already delivered to each target from its manifest
+    source_files = {}
+    delivered_files = {}
+    for copy_from, copy_to in sources.items():
+        source_files[copy_from] = sorted(os.listdir(copy_from))
+        delivered_files[copy_from] = _load_copy_manifest(copy_from, copy_to)
+
+        total_files_in_copy_location = len(source_files[copy_from])
+        assert total_files_in_copy_location >= copy_n_files, f"The source location {copy_from} contains only {total_files_in_copy_location} files, but you specified {copy_n_files}  files to copy. Please specify a number less than or equal to the total number of files available."
+
+    ## Iteration n makes sure the first n files of each source are delivered, so each iteration only has to look at file n
     for n in range(copy_n_files):
-        n = n + 1
-        copy_files(copy_from = f'{copy_from_source}/orders/stream_json', copy_to = f'{copy_to_target}/orders', n = n, sleep=sleep_set)
-        copy_files(copy_from = f'{copy_from_source}/customers/stream_json', copy_to = f'{copy_to_target}/customers', n = n, sleep=sleep_set)
-        copy_files(copy_from = f'{copy_from_source}/status/stream_json', copy_to = f'{copy_to_target}/status', n = n, sleep=sleep_set)
+        for copy_from, copy_to in sources.items():
+            file = source_files[copy_from][n]
+
+            print(f"\n----------------Loading files to user's volume: '{copy_to}'----------------")
+            if file in delivered_files[copy_from]:
+                print(f'File number {n + 1} - {file} is already in the source volume "{copy_to}". Skipping file.')
+                continue
+
+            print(f'File number {n + 1} - Copying file {copy_from}/{file} --> {copy_to}/{file}.')
+            _copy_single_file(f'{copy_from}/{file}', f'{copy_to}/{file}')
+            delivered_files[copy_from].add(file)
+            _append_copy_manifest(copy_to, [file])
+
+            ## Sleep after load
+            time.sleep(sleep_set)
+
+# COMMAND ----------
+
+## Hidden manifest in the bundle folder with the landed files already coalesced into bundles
+_COALESCE_MANIFEST_NAME = '.coalesce_manifest.json'
+
+
+def _json_records_with_lineage(file_path: str, lineage_column: str, file_name: str):
+    '''
+    Yields each record of a JSON lines file as a JSON line with the lineage column added.
+
+    Records are rewritten by inserting the lineage key after the opening brace, so the file is streamed line by line without
+    parsing each record. Only lines that contain the quoted lineage column name are parsed, to check that the record does not
+    already have that key. Files that are not JSON lines (a single JSON object or array) are parsed as a whole.
+
+    Raises a ValueError if a record already has the lineage column, since the lineage value would be ambiguous, or if a record
+    is not a JSON object, since the lineage column can only be added to objects.
+    '''
+    import json
+
+    def lineage_clash_error() -> ValueError:
+        return ValueError(f"A record in {file_path} already has a '{lineage_column}' key. Use another lineage_column in coalesce_landing_files.")
+
+    def not_an_object_error(record: str) -> ValueError:
+        return ValueError(f"A record in {file_path} is not a JSON object: {record[:100]}")
+
+    quoted_lineage_column = json.dumps(lineage_column)
+    lineage = quoted_lineage_column + ': ' + json.dumps(file_name)
+    with open(file_path, 'r', encoding = 'utf-8') as f:
+        first_line = f.readline()
+        if first_line.strip() and not (first_line.lstrip().startswith('{') and first_line.rstrip().endswith('}')):
+            f.seek(0)
+            records = json.load(f)
+            for record in records if isinstance(records, list) else [records]:
+                if not isinstance(record, dict):
+                    raise not_an_object_error(json.dumps(record))
+                if lineage_column in record:
+                    raise lineage_clash_error()
+                yield json.dumps({lineage_column: file_name, **record}) + '\n'
+            return
+
+        f.seek(0)
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if not (line.startswith('{') and line.endswith('}')):
+                raise not_an_object_error(line)
+            if quoted_lineage_column in line and lineage_column in json.loads(line):
+                raise lineage_clash_error()
+            yield '{' + lineage + (', ' if line[1:-1].strip() else '') + line[1:] + '\n'
+
+
+def coalesce_landing_files(landing_path: str,
+                           bundle_path: str = None,
+                           target_bundle_bytes: int = 128 * 1024 * 1024,
+                           file_format: str = 'json',
+                           lineage_column: str = 'source_file',
+                           delete_coalesced: bool = False) -> dict:
+    '''
+    Coalesces the small files landed in a folder into size-targeted bundles before bronze ingestion.
+
+    Every record in a bundle gets a lineage column with the name of the landed file it came from, so bronze keeps per-record source
+    file lineage while Auto Loader lists and reads one bundle instead of hundreds of tiny files per trigger. Files are streamed
+    into the bundle, so nothing is fully loaded in memory.
+
+    Bundles are written as hidden partial files and renamed when complete, so Auto Loader never sees a partial bundle. The landed files
+    already coalesced are tracked in a hidden manifest in the bundle folder, so each call only bundles the newly landed files.
+    A bundle is committed before the manifest is updated. If a run is interrupted between the two, the next run bundles those files again.
+
+    Parameters:
+    - landing_path (str): The folder the small files land in.
+    - bundle_path (str, optional): The folder to write the bundles to. Default is '<landing_path>_coalesced'.
+    - target_bundle_bytes (int, optional): Start a new bundle once the current one reaches this size. Default is 128 MB.
+    - file_format (str, optional): 'json' (JSON lines) or 'csv' (with a header). CSV files with a different header start a new bundle. Default is 'json'.
+    - lineage_column (str, optional): The column with the landed file name added to every record. Default is 'source_file'.
+                                      A ValueError is raised if a landed record already has this column.
+    - delete_coalesced (bool, optional): Delete the landed files once their bundle is committed. Default is False.
+
+    Returns:
+    - dict: The number of landed files coalesced, the bundles written, the bundle bytes and the elapsed seconds.
+
+    Example:
+    - coalesce_landing_files(f'{DA.paths.working_dir}/orders', target_bundle_bytes=128 * 1024 * 1024)
+    '''
+    import os
+    import csv
+    import json
+    import time
+
+    if file_format not in ('json', 'csv'):
+        raise ValueError(f"file_format must be 'json' or 'csv', got '{file_format}'.")
+
+    bundle_path = bundle_path or f'{landing_path}_coalesced'
+    os.makedirs(bundle_path, exist_ok = True)
+    start_time = time.perf_counter()
+
+    ## Load the landed files already coalesced
+    manifest_path = os.path.join(bundle_path, _COALESCE_MANIFEST_NAME)
+    coalesced = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            coalesced = json.load(f)['bundles']
+    coalesced_files = {file for files in coalesced.values() for file in files}
+
+    ## Hidden files (partial copies, manifests) are skipped, the same as Auto Loader does
+    new_files = sorted(file for file in os.listdir(landing_path)
+                       if not file.startswith(('.', '_')) and file not in coalesced_files and os.path.isfile(os.path.join(landing_path, file)))
+    if not new_files:
+        print(f'No new files to coalesce in {landing_path}.')
+        return {'files': 0, 'bundles': [], 'bytes': 0, 'seconds': time.perf_counter() - start_time}
+
+    run_id = time.strftime('%Y%m%d%H%M%S', time.gmtime())
+    bundles = []
+    bundle_bytes = 0
+    state = {'file': None, 'writer': None, 'name': None, 'files': [], 'header': None}
+
+    def commit_bundle():
+        nonlocal bundle_bytes
+        if state['file'] is None:
+            return
+        partial_file = state['file'].name
+        state['file'].flush()
+        os.fsync(state['file'].fileno())
+        state['file'].close()
+        os.replace(partial_file, os.path.join(bundle_path, state['name']))
+
+        bundle_bytes = bundle_bytes + os.path.getsize(os.path.join(bundle_path, state['name']))
+        coalesced[state['name']] = state['files']
+        with open(f'{manifest_path}.tmp', 'w') as f:
+            json.dump({'source': landing_path, 'bundles': coalesced}, f)
+        os.replace(f'{manifest_path}.tmp', manifest_path)
+        if delete_coalesced:
+            for file in state['files']:
+                os.remove(os.path.join(landing_path, file))
+
+        print(f"Coalesced {len(state['files'])} file(s) into {bundle_path}/{state['name']}.")
+        bundles.append(state['name'])
+        state.update({'file': None, 'writer': None, 'name': None, 'files': [], 'header': None})
+
+    def open_bundle(header = None):
+        state['name'] = f'bundle-{run_id}-{len(coalesced):05}.{file_format}'
+        state['file'] = open(os.path.join(bundle_path, '.' + state['name'] + _PARTIAL_SUFFIX), 'w', encoding = 'utf-8', newline = '')
+        if file_format == 'csv':
+            state['writer'] = csv.writer(state['file'])
+            state['writer'].writerow(header + [lineage_column])
+            state['header'] = header
+
+    try:
+        for file in new_files:
+            file_path = os.path.join(landing_path, file)
+
+            if file_format == 'json':
+                if state['file'] is None:
+                    open_bundle()
+                state['file'].writelines(_json_records_with_lineage(file_path, lineage_column, file))
+            else:
+                with open(file_path, 'r', encoding = 'utf-8', newline = '') as f:
+                    reader = csv.reader(f)
+                    header = next(reader, None)
+                    ## Empty files have no records to coalesce
+                    if header is None:
+                        continue
+                    if lineage_column in header:
+                        raise ValueError(f"{file_path} already has a '{lineage_column}' column. Use another lineage_column in coalesce_landing_files.")
+                    if state['file'] is not None and header != state['header']:
+                        commit_bundle()
+                    if state['file'] is None:
+                        open_bundle(header)
+                    state['writer'].writerows(row + [file] for row in reader)
+
+            state['files'].append(file)
+            if state['file'].tell() >= target_bundle_bytes:
+                commit_bundle()
+
+        commit_bundle()
+    except Exception:
+        ## Remove the bundle in progress. Committed bundles are kept in the manifest.
+        if state['file'] is not None:
+            state['file'].close()
+            os.remove(state['file'].name)
+        raise
+
+    elapsed = time.perf_counter() - start_time
+    print(f'Coalesced {len(new_files)} file(s) into {len(bundles)} bundle(s), {bundle_bytes} bytes in {elapsed:.2f}s.')
+    return {'files': len(new_files), 'bundles': bundles, 'bytes': bundle_bytes, 'seconds': elapsed}
 
 # COMMAND ----------
 
 import os
-def create_directory_in_user_volume(user_default_volume_path: str, create_folders: list):
+def create_directory_in_user_volume(user_default_volume_path: str, create_folders: list, max_workers: int = 16, verbose: bool = True) -> dict:
     '''
     Creates multiple (or single) directories in the specified volume path.
 
+    Folders can be nested paths (e.g. 'tenant_1/orders') to lay out a whole landing-zone tree in one call. Each parent directory is
+    listed at most once to find the folders that are missing, and the missing folders are created concurrently. Only the deepest
+    missing folders are created since mkdirs also creates their parents.
+
     Parameters:
     - user_default_volume_path (str): The base directory path where the folders will be created. 
                                       You can use the default DA.paths.working_dir as the user's volume path.
-    - create_folders (list): A list of strings representing folder names to be created within the base directory.
+    - create_folders (list): A list of strings representing folder names (or nested folder paths) to be created within the base directory.
+    - max_workers (int, optional): Number of folders to create at the same time. Default is 16.
+    - verbose (bool, optional): If True, prints a line for every folder. Otherwise only prints a summary. Default is True.
 
     Returns:
-    - None: This function does not return any values but prints log information about the created directories.
+    - dict: The full paths of the folders that were 'created' and that already 'existing', and the elapsed 'seconds'.
 
     Example: 
     - create_directory_in_user_volume(user_default_volume_path=DA.paths.working_dir, create_folders=['customers', 'orders', 'status'])
+    - create_directory_in_user_volume(user_default_volume_path=DA.paths.working_dir, create_folders=[f'tenant_{i}/{source}' for i in range(100) for source in ['customers', 'orders', 'status']])
     '''
-    
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    start_time = time.perf_counter()
+
+    ## Listing of each parent directory, keyed by the path relative to the base directory
+    listings = {}
+
+    def folder_exists(relative_folder: str) -> bool:
+        parent, name = os.path.split(relative_folder)
+        if parent and not folder_exists(parent):
+            return False
+        if parent not in listings:
+            full_parent = os.path.join(user_default_volume_path, parent)
+            listings[parent] = set(os.listdir(full_parent)) if os.path.isdir(full_parent) else set()
+        return name in listings[parent]
+
+    ## Skip empty entries such as '' or '/', which would otherwise normalize to the base directory itself ('.')
+    requested_folders = list(dict.fromkeys(os.path.normpath(folder.strip('/')) for folder in create_folders if folder.strip('/')))
+    requested_folders = [folder for folder in requested_folders if folder != '.']
+    existing = [folder for folder in requested_folders if folder_exists(folder)]
+    existing_set = set(existing)
+    missing = [folder for folder in requested_folders if folder not in existing_set]
+
+    ## A missing folder that is the parent of another missing folder is created by mkdirs of the deeper folder
+    parent_folders = set()
+    for folder in missing:
+        parent = os.path.dirname(folder)
+        while parent and parent not in parent_folders:
+            parent_folders.add(parent)
+            parent = os.path.dirname(parent)
+    leaf_folders = [folder for folder in missing if folder not in parent_folders]
+
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        list(executor.map(lambda folder: dbutils.fs.mkdirs(f'{user_default_volume_path}/{folder}'), leaf_folders))
+
+    result = {
+        'created': [f'{user_default_volume_path}/{folder}' for folder in missing],
+        'existing': [f'{user_default_volume_path}/{folder}' for folder in existing],
+        'seconds': time.perf_counter() - start_time
+    }
+
     print('----------------------------------------------------------------------------------------')
-    for folder in create_folders:
+    if verbose:
+        for create_folder in result['created']:
+            print(f'Creating folder: {create_folder}')
+        for create_folder in result['existing']:
+            print(f"Directory {create_folder} already exists. No action taken.")
+    print(f"Created {len(result['created'])} folder(s), {len(result['existing'])} already existed ({result['seconds']:.2f}s).")
+    print('----------------------------------------------------------------------------------------\n')
 
-        create_folder = f'{user_default_volume_path}/{folder}'
+    return result
 
-        if not os.path.exists(create_folder):
-        # If it doesn't exist, create the directory
-            dbutils.fs.mkdirs(create_folder)
-            print(f'Creating folder: {create_folder}')
+# COMMAND ----------
+
+import sqlite3
+
+## Hidden copy of a VolumeFileIndex kept in the root of the indexed volume path, so the index survives cluster restarts
+_VOLUME_FILE_INDEX_NAME = '.volume_file_index.sqlite'
+
+
+class VolumeFileIndex:
+    """
+    Persistent inventory of the files under a volume path (relative path, size, mtime and optional SHA-256) stored in a local SQLite file.
 
+    - `refresh` is incremental: every folder is listed, but only files that are not in the index yet are stat'ed (and hashed).
+      Directory modification times are not used, since object-store backed volume directories do not reliably keep them.
+    - `new_since`, `missing_from`, `exists` and `is_folder_empty` answer from the index without listing the volume.
+    - The SQLite file is kept on the driver's local disk, since SQLite locking is not supported on volume paths. With persist=True
+      `save` copies it to '<root_path>/.volume_file_index.sqlite', which is restored after a cluster restart. Updates are not saved
+      automatically; call `save` once at the end of the setup.
+    - copy_files, delete_source_files and LabDataSetup accept a file_index to read from and keep up to date.
+
+    Example:
+      index = VolumeFileIndex(f'{DA.paths.working_dir}/orders')
+      index.refresh()
+      index.new_since(last_run_time)
+      index.save()
+    """
+
+    def __init__(self, root_path: str, index_path: str = None, with_hash: bool = False, persist: bool = True):
+        import os
+        import shutil
+        import hashlib
+        import tempfile
+
+        self.root_path = root_path.rstrip('/')
+        self.with_hash = with_hash
+        if index_path is None:
+            index_dir = os.path.join('/local_disk0/tmp' if os.path.isdir('/local_disk0/tmp') else tempfile.gettempdir(), 'volume_file_index')
+            os.makedirs(index_dir, exist_ok = True)
+            index_path = os.path.join(index_dir, hashlib.sha1(self.root_path.encode('utf-8')).hexdigest() + '.sqlite')
+        self.index_path = index_path
+        self.persist_path = f'{self.root_path}/{_VOLUME_FILE_INDEX_NAME}' if persist else None
+
+        ## Restore the persisted copy if the local index is missing (e.g. after a cluster restart) or older
+        if self.persist_path and os.path.isfile(self.persist_path):
+            if not os.path.exists(self.index_path) or os.path.getmtime(self.persist_path) > os.path.getmtime(self.index_path):
+                shutil.copyfile(self.persist_path, self.index_path)
+
+        self._connection = sqlite3.connect(self.index_path, check_same_thread = False)
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, folder TEXT NOT NULL, size INTEGER, mtime REAL, hash TEXT, first_seen REAL);
+            CREATE INDEX IF NOT EXISTS files_folder ON files (folder);
+            CREATE INDEX IF NOT EXISTS files_first_seen ON files (first_seen);
+            CREATE TABLE IF NOT EXISTS folders (path TEXT PRIMARY KEY, parent TEXT);
+        ''')
+
+    def relative_path(self, path: str) -> str:
+        '''
+        Returns the path relative to the root path, or '' for the root path itself. Relative paths are returned unchanged.
+        '''
+        if not path.startswith('/'):
+            return path.strip('/')
+        path = path.rstrip('/')
+        if path == self.root_path:
+            return ''
+        if not path.startswith(self.root_path + '/'):
+            raise ValueError(f"Path '{path}' is not under the indexed root path '{self.root_path}'.")
+        return path[len(self.root_path) + 1:]
+
+    def refresh(self, full: bool = False, folder: str = '') -> dict:
+        '''
+        Updates the index with the current files under the root path (or only under folder) and returns the number of folders listed
+        and files added, changed and removed.
+
+        Files already in the index are not stat'ed again. Use full=True to also detect files that were rewritten in place.
+        '''
+        import time
+
+        stats = {'folders_listed': 0, 'added': 0, 'changed': 0, 'removed': 0}
+        now = time.time()
+
+        with self._connection:
+            self._refresh_folder(self.relative_path(folder), now, stats, full)
+        return stats
+
+    def _refresh_folder(self, folder: str, now: float, stats: dict, full: bool):
+        import os
+
+        full_folder = os.path.join(self.root_path, folder) if folder else self.root_path
+        cursor = self._connection.cursor()
+
+        if not os.path.isdir(full_folder):
+            self._remove_folder(folder, stats)
+            return
+
+        stats['folders_listed'] = stats['folders_listed'] + 1
+        indexed = {path: (size, mtime) for path, size, mtime in cursor.execute('SELECT path, size, mtime FROM files WHERE folder = ?', (folder,))}
+        seen = set()
+        subfolders = []
+
+        with os.scandir(full_folder) as entries:
+            for entry in entries:
+                relative_path = os.path.join(folder, entry.name) if folder else entry.name
+                if entry.is_dir(follow_symlinks = False):
+                    subfolders.append(relative_path)
+                    continue
+                if not folder and entry.name.startswith(_VOLUME_FILE_INDEX_NAME):
+                    continue
+
+                seen.add(relative_path)
+                if relative_path not in indexed:
+                    entry_stat = entry.stat(follow_symlinks = False)
+                    stats['added'] = stats['added'] + 1
+                    cursor.execute('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                                   (relative_path, folder, entry_stat.st_size, entry_stat.st_mtime, self._hash(entry.path), now))
+                elif full:
+                    entry_stat = entry.stat(follow_symlinks = False)
+                    if indexed[relative_path] != (entry_stat.st_size, entry_stat.st_mtime):
+                        stats['changed'] = stats['changed'] + 1
+                        cursor.execute('UPDATE files SET size = ?, mtime = ?, hash = ? WHERE path = ?',
+                                       (entry_stat.st_size, entry_stat.st_mtime, self._hash(entry.path), relative_path))
+
+        removed = [path for path in indexed if path not in seen]
+        stats['removed'] = stats['removed'] + len(removed)
+        cursor.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in removed])
+
+        ## Remove subfolders that no longer exist and record the folder
+        for (path,) in cursor.execute('SELECT path FROM folders WHERE parent = ?', (folder,)).fetchall():
+            if path not in subfolders:
+                self._remove_folder(path, stats)
+        cursor.execute('INSERT OR REPLACE INTO folders (path, parent) VALUES (?, ?)', (folder, None if folder == '' else os.path.dirname(folder)))
+
+        for subfolder in subfolders:
+            self._refresh_folder(subfolder, now, stats, full)
+
+    def record(self, file_paths: list):
+        '''
+        Adds or updates files that a helper has just written, so the next refresh does not have to stat them.
+        '''
+        import os
+        import time
+
+        now = time.time()
+        with self._connection:
+            for file_path in file_paths:
+                relative_path = self.relative_path(file_path)
+                file_stat = os.stat(os.path.join(self.root_path, relative_path))
+                self._connection.execute('''INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)
+                                            ON CONFLICT (path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime, hash = excluded.hash''',
+                                         (relative_path, os.path.dirname(relative_path), file_stat.st_size, file_stat.st_mtime,
+                                          self._hash(os.path.join(self.root_path, relative_path)), now))
+
+    def forget(self, folder: str = ''):
+        '''
+        Removes a folder and everything under it from the index, after a helper has deleted its files.
+        '''
+        with self._connection:
+            self._remove_folder(self.relative_path(folder), {'removed': 0})
+
+    def save(self):
+        '''
+        Copies the local SQLite file to the hidden persisted copy in the root path, replacing the previous copy in a single rename.
+        Does nothing if the index was created with persist=False.
+        '''
+        import os
+        import shutil
+
+        if self.persist_path and os.path.isdir(self.root_path):
+            temp_path = f'{self.persist_path}.tmp'
+            shutil.copyfile(self.index_path, temp_path)
+            os.replace(temp_path, self.persist_path)
+
+    def _remove_folder(self, folder: str, stats: dict):
+        cursor = self._connection.cursor()
+        if folder:
+            pattern = folder.replace('%', '\\%').replace('_', '\\_') + '/%'
+            stats['removed'] = stats['removed'] + cursor.execute("SELECT count(*) FROM files WHERE folder = ? OR folder LIKE ? ESCAPE '\\'", (folder, pattern)).fetchone()[0]
+            cursor.execute("DELETE FROM files WHERE folder = ? OR folder LIKE ? ESCAPE '\\'", (folder, pattern))
+            cursor.execute("DELETE FROM folders WHERE path = ? OR path LIKE ? ESCAPE '\\'", (folder, pattern))
         else:
-            print(f"Directory {create_folder} already exists. No action taken.")
-        
-    print('----------------------------------------------------------------------------------------\n')
+            stats['removed'] = stats['removed'] + cursor.execute('SELECT count(*) FROM files').fetchone()[0]
+            cursor.execute('DELETE FROM files')
+            cursor.execute('DELETE FROM folders')
+
+    def _hash(self, file_path: str):
+        return _file_checksum(file_path) if self.with_hash else None
+
+    def files(self, folder: str = None, recursive: bool = False) -> list:
+        '''
+        Returns (relative path, size, mtime, hash) for every indexed file, or only for the files directly in the folder.
+        With recursive=True the files in the subfolders of the folder are returned as well.
+        '''
+        folder = None if folder is None else folder.strip('/')
+        if folder is None or (recursive and not folder):
+            return self._connection.execute('SELECT path, size, mtime, hash FROM files ORDER BY path').fetchall()
+        if recursive:
+            pattern = folder.replace('%', '\\%').replace('_', '\\_') + '/%'
+            return self._connection.execute("SELECT path, size, mtime, hash FROM files WHERE folder = ? OR folder LIKE ? ESCAPE '\\' ORDER BY path",
+                                            (folder, pattern)).fetchall()
+        return self._connection.execute('SELECT path, size, mtime, hash FROM files WHERE folder = ? ORDER BY path', (folder,)).fetchall()
+
+    def new_since(self, timestamp: float) -> list:
+        '''
+        Returns the relative paths of the files first seen by a refresh after the timestamp (seconds since the epoch).
+        '''
+        return [path for (path,) in self._connection.execute('SELECT path FROM files WHERE first_seen > ? ORDER BY path', (timestamp,))]
+
+    def missing_from(self, other: 'VolumeFileIndex', compare: str = 'name') -> list:
+        '''
+        Returns the relative paths of the files in this index that are missing from the other index.
+        With compare='size' (or 'hash', if both indexes store hashes) files that differ are also returned.
+        '''
+        other_files = {path: (size, file_hash) for path, size, _, file_hash in other.files()}
+        missing = []
+        for path, size, _, file_hash in self.files():
+            if path not in other_files:
+                missing.append(path)
+            elif compare == 'size' and other_files[path][0] != size:
+                missing.append(path)
+            elif compare == 'hash' and other_files[path][1] != file_hash:
+                missing.append(path)
+        return missing
+
+    def exists(self, relative_path: str) -> bool:
+        return self._connection.execute('SELECT 1 FROM files WHERE path = ?', (relative_path.strip('/'),)).fetchone() is not None
+
+    def is_folder_empty(self, folder: str = '') -> bool:
+        '''
+        Returns True if no files are indexed in the folder or any of its subfolders.
+        '''
+        folder = folder.strip('/')
+        if not folder:
+            return self._connection.execute('SELECT 1 FROM files LIMIT 1').fetchone() is None
+        pattern = folder.replace('%', '\\%').replace('_', '\\_') + '/%'
+        return self._connection.execute("SELECT 1 FROM files WHERE folder = ? OR folder LIKE ? ESCAPE '\\' LIMIT 1", (folder, pattern)).fetchone() is None
+
+    def __str__(self):
+        file_count = self._connection.execute('SELECT count(*) FROM files').fetchone()[0]
+        return f"VolumeFileIndex(root_path={self.root_path}, index_path={self.index_path}, files={file_count})"
 
 # COMMAND ----------
 
@@ -281,54 +1638,97 @@ def display_config_values(config_values):
 
 # COMMAND ----------
 
-def drop_tables(in_catalog: str, in_schema: list, dry_run: bool = False) -> list:
+## DROP statement to use for each information_schema table type. Any other type is dropped with DROP TABLE.
+_DROP_STATEMENT_BY_TABLE_TYPE = {
+    'VIEW': 'DROP VIEW',
+    'MATERIALIZED_VIEW': 'DROP MATERIALIZED VIEW'
+}
+
+
+def _drop_object(table_full_name: str, table_type: str) -> dict:
+    '''
+    Drops a single table or view with the DROP statement for its type and returns the statement, the elapsed time and any error.
+    '''
+    import time
+
+    statement = f"{_DROP_STATEMENT_BY_TABLE_TYPE.get(table_type, 'DROP TABLE')} IF EXISTS {table_full_name}"
+    start_time = time.perf_counter()
+    error = None
+    try:
+        spark.sql(statement)
+    except Exception as e:
+        error = str(e)
+    return {'name': table_full_name, 'type': table_type, 'statement': statement, 'seconds': time.perf_counter() - start_time, 'error': error}
+
+
+def drop_tables(in_catalog: str, in_schema: list, dry_run: bool = False, max_workers: int = 8) -> list:
     """
-    Drops all tables and views in the specified schema within a given catalog.
+    Drops all tables and views in the specified schemas within a given catalog.
+
+    The live table types of the catalog are read in one metadata query and each object is dropped directly with the matching
+    DROP TABLE, DROP VIEW or DROP MATERIALIZED VIEW statement. Drops across all schemas run on a thread pool of `max_workers` threads.
+    A failed drop does not stop the other drops. Failures are printed and returned.
 
     Args:
         in_catalog (str): The catalog name (e.g., 'dbacademy_peter').
-        in_schema (str): The schema name (e.g., 'default').
+        in_schema (list): The schema names (e.g., ['default']).
         dry_run (bool): If True, only prints tables that would be dropped without actually dropping them.
+        max_workers (int): Number of drops to run at the same time. Default is 8.
 
     Returns:
-        list: Fully qualified names of the tables that were dropped (or would be dropped in dry-run mode).
+        list: One dictionary per table or view with the fully qualified name, table type, DROP statement, elapsed seconds and error (None if dropped).
+              In dry-run mode the elapsed seconds are 0 and nothing is dropped.
 
     Example:
-    >>> drop_tables(in_catalog='dbacademy_peter', in_schema='1_bronze_db')
+    >>> drop_tables(in_catalog='dbacademy_peter', in_schema=['1_bronze_db'])
     """
+    from concurrent.futures import ThreadPoolExecutor
+
     # Check if catalog exists
-    catalogs = [row.catalog for row in spark.sql("SHOW CATALOGS").collect()]
-    if in_catalog not in catalogs:
+    if in_catalog not in catalog_metadata_cache.catalogs(refresh = True):
         raise ValueError(f"Catalog '{in_catalog}' does not exist.")
 
-    ## Delete tables and views in schema
+    ## Pipeline runs create tables outside the helpers, so reload the schemas and tables of the catalog once (one query each)
+    current_schemas = catalog_metadata_cache.schemas(in_catalog, refresh = True)
+    catalog_metadata_cache.tables(in_catalog, None, refresh = True)
+
+    ## Collect the tables and views to drop in every schema
+    objects_to_drop = []
     for schema in in_schema:
         
         # Check if schema exists in the catalog
-        full_schema = f"{in_catalog}.{schema}"
-        if not spark.catalog.databaseExists(full_schema):
+        if schema not in current_schemas:
             raise ValueError(f"Schema '{schema}' does not exist in catalog '{in_catalog}'.")
         
         print(f"\n{'Previewing' if dry_run else 'Dropping'} all tables in {in_catalog}.{schema}:")
 
-        # Get all tables in the schema
-        tables = spark.sql(f"SHOW TABLES IN {in_catalog}.{schema}").collect()
+        # Get all tables in the schema with their type
+        tables = catalog_metadata_cache.tables(in_catalog, schema)
 
         if not tables:
             print(f"No tables found in schema {in_catalog}.{schema}. Nothing to drop.")
         else:
-            table_names = [f"{in_catalog}.{schema}.{t.tableName}" for t in tables]
-
-            for table_full_name in table_names:
+            for table_name in sorted(tables):
+                objects_to_drop.append((f"{in_catalog}.{schema}.{table_name}", tables[table_name]))
                 if dry_run:
-                    print(f"Would drop: {table_full_name}")
-                else:
-                    try:
-                        spark.sql(f"DROP TABLE IF EXISTS {table_full_name}")
-                        print(f"Dropped TABLE: {table_full_name}")
-                    except:
-                        spark.sql(f"DROP VIEW IF EXISTS {table_full_name}")
-                        print(f"Dropped VIEW: {table_full_name}")
+                    print(f"Would drop: {in_catalog}.{schema}.{table_name} ({tables[table_name]})")
+
+    if dry_run:
+        return [{'name': table_full_name, 'type': table_type, 'statement': None, 'seconds': 0.0, 'error': None} for table_full_name, table_type in objects_to_drop]
+
+    print(f"\nDropping {len(objects_to_drop)} table(s) and view(s) with up to {max_workers} concurrent drops:")
+
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        results = list(executor.map(lambda table: _drop_object(*table), objects_to_drop))
+
+    for result in results:
+        if result['error'] is None:
+            print(f"Dropped {result['type']}: {result['name']} ({result['seconds']:.2f}s)")
+        else:
+            print(f"Failed to drop {result['type']}: {result['name']}: {result['error']}")
+
+    catalog_metadata_cache.invalidate(catalog = in_catalog, kind = 'tables')
+    return results
 
 # COMMAND ----------
 
@@ -338,6 +1738,118 @@ import json
 from databricks.sdk import WorkspaceClient
 
 
+def _find_pipeline_id(w, pipeline_name: str):
+    '''
+    Returns the id of the pipeline with exactly this name, or None if it does not exist.
+
+    The name is filtered on the server, so only the matching pipelines are listed instead of every pipeline in the workspace.
+    '''
+    name_filter = pipeline_name.replace("'", "''")
+    for pipeline in w.pipelines.list_pipelines(filter = f"name LIKE '{name_filter}'"):
+        if pipeline.name == pipeline_name:
+            return pipeline.pipeline_id
+    return None
+
+
+def _list_pipeline_ids_by_name(w) -> dict:
+    '''
+    Lists every pipeline in the workspace once, with the largest page size, and returns a dictionary of pipeline name to pipeline id.
+    '''
+    return {pipeline.name: pipeline.pipeline_id for pipeline in w.pipelines.list_pipelines(max_results = 100)}
+
+
+def _pipeline_settings(pipeline_name: str, 
+                       root_path_folder_name: str,
+                       source_folder_names: list = [],
+                       catalog_name: str = 'dbacademy',
+                       schema_name: str = 'default',
+                       serverless: bool = True,
+                       configuration: dict = {},
+                       continuous: bool = False,
+                       photon: bool = True,
+                       channel: str = 'PREVIEW',
+                       development: bool = True,
+                       pipeline_type = 'WORKSPACE'
+                       ) -> dict:
+    '''
+    Returns the pipeline settings used to create or edit a pipeline. See create_declarative_pipeline for the parameters.
+    '''
+
+    ## Create empty dictionary
+    create_dlt_pipeline_call = {}
+
+    ## Pipeline type
+    create_dlt_pipeline_call['pipeline_type'] = pipeline_type
+
+    ## Modify dictionary for specific DLT configurations
+    create_dlt_pipeline_call['name'] = pipeline_name
+
+    ## Set paths to root and source folders
+    main_course_folder_path = os.getcwd()
+
+    main_path_to_dlt_project_folder = os.path.join('/', main_course_folder_path, root_path_folder_name)
+    create_dlt_pipeline_call['root_path'] = main_path_to_dlt_project_folder
+
+    ## Add path of root folder to source folder names
+    add_path_to_folder_names = [os.path.join(main_path_to_dlt_project_folder, folder_name, '**') for folder_name in source_folder_names]
+    source_folders_path = [{'glob':{'include':folder_name}} for folder_name in add_path_to_folder_names]
+    create_dlt_pipeline_call['libraries'] = source_folders_path
+
+    ## Set default catalog and schema
+    create_dlt_pipeline_call['catalog'] = catalog_name
+    create_dlt_pipeline_call['schema'] = schema_name
+
+    ## Set serverless compute
+    create_dlt_pipeline_call['serverless'] = serverless
+
+    ## Set configuration parameters
+    create_dlt_pipeline_call['configuration'] = configuration
+
+    ## Set if continouous or not
+    create_dlt_pipeline_call['continuous'] = continuous 
+
+    ## Set to use Photon
+    create_dlt_pipeline_call['photon'] = photon
+
+    ## Set DLT channel
+    create_dlt_pipeline_call['channel'] = channel
+
+    ## Set if development mode
+    create_dlt_pipeline_call['development'] = development
+
+    return create_dlt_pipeline_call
+
+
+def _with_registry_schemas(configuration: dict, schema_sources: list = None, rule_sets: list = None) -> dict:
+    '''
+    Returns the pipeline configuration with the 'schema.<source>' keys of the schema registry and the 'rules.<table>' keys of the
+    compiled rule sets added. Keys already set in configuration win.
+    '''
+    registry_configuration = {}
+    if schema_sources:
+        registry_configuration.update(schema_registry_configuration(schema_sources))
+    if rule_sets:
+        registry_configuration.update(rule_set_configuration(rule_sets))
+    return {**registry_configuration, **configuration}
+
+
+def _create_or_update_pipeline(w, pipeline_settings: dict, pipeline_id: str = None, upsert: bool = False) -> dict:
+    '''
+    Creates the pipeline, or edits the existing pipeline with pipeline_id in place if upsert is True.
+    Returns the pipeline id and the action taken ('created' or 'updated').
+    Raises a ValueError if the pipeline already exists and upsert is False.
+    '''
+    if pipeline_id is not None and not upsert:
+        raise ValueError(f"Lakeflow Declarative Pipeline name '{pipeline_settings['name']}' already exists. Please delete the pipeline using the UI and rerun the cell to recreate the pipeline, or set upsert=True to update it.")
+
+    if pipeline_id is not None:
+        w.api_client.do('PUT', f'/api/2.0/pipelines/{pipeline_id}', body={**pipeline_settings, 'id': pipeline_id})
+        return {'pipeline_id': pipeline_id, 'action': 'updated'}
+
+    response = w.api_client.do('POST', '/api/2.0/pipelines', body=pipeline_settings)
+    return {'pipeline_id': response.get('pipeline_id') if isinstance(response, dict) else None, 'action': 'created'}
+
+
 def create_declarative_pipeline(pipeline_name: str, 
                         root_path_folder_name: str,
                         source_folder_names: list = [],
@@ -349,12 +1861,17 @@ def create_declarative_pipeline(pipeline_name: str,
                         photon: bool = True,
                         channel: str = 'PREVIEW',
                         development: bool = True,
-                        pipeline_type = 'WORKSPACE'
+                        pipeline_type = 'WORKSPACE',
+                        upsert: bool = False,
+                        schema_sources: list = None,
+                        rule_sets: list = None
                         ):
   
     '''
   Creates the specified DLT pipeline.
 
+  The name clash check uses a server-side name filter, so it does not list every pipeline in the workspace.
+
   Parameters:
   ----------
   pipeline_name : str
@@ -381,11 +1898,19 @@ def create_declarative_pipeline(pipeline_name: str,
       If True, the pipeline will be set up for development. Default is True.
   pipeline_type : str, optional
       The type of the pipeline (e.g., 'WORKSPACE'). Default is 'WORKSPACE'.
+  upsert : bool, optional
+      If True, a pipeline with the same name is edited in place with these settings instead of raising a ValueError. Default is False.
+  schema_sources : list, optional
+      Source names from the schema registry (e.g. ['orders']). Their 'schema.<source>' keys are added to the configuration so the
+      bronze readers use the registry schema instead of inferring one. Default is None.
+  rule_sets : list, optional
+      Paths of rule set files (e.g. ['./Includes/rules/orders_silver_demo3.json']). The compiled rules are added to the configuration
+      as 'rules.<table>' keys for the pipelines that check data quality with the rule-set engine. Default is None.
 
   Returns:
   -------
-  None
-      This function does not return anything. It creates the DLT pipeline based on the provided parameters.
+  str
+      The id of the created or updated pipeline.
 
   Example:
   --------
@@ -394,61 +1919,165 @@ def create_declarative_pipeline(pipeline_name: str,
                       source_folder_names=['orders', 'status'])
   '''
   
+    configuration = _with_registry_schemas(configuration, schema_sources, rule_sets)
+
     w = WorkspaceClient()
-    for pipeline in w.pipelines.list_pipelines():
-        if pipeline.name == pipeline_name:
-            raise ValueError(f"Lakeflow Declarative Pipeline name '{pipeline_name}' already exists. Please delete the pipeline using the UI and rerun the cell to recreate the pipeline.")
+    pipeline_settings = _pipeline_settings(pipeline_name, root_path_folder_name, source_folder_names, catalog_name, schema_name,
+                                           serverless, configuration, continuous, photon, channel, development, pipeline_type)
+    pipeline_id = _find_pipeline_id(w, pipeline_name)
 
-    ## Create empty dictionary
-    create_dlt_pipeline_call = {}
+    ## Creat or update DLT pipeline
 
-    ## Pipeline type
-    create_dlt_pipeline_call['pipeline_type'] = pipeline_type
+    print(f"{'Updating' if pipeline_id and upsert else 'Creating'} the Lakeflow Declarative Pipeline '{pipeline_name}'...")
+    print(f"Root folder path: {pipeline_settings['root_path']}")
+    print(f"Source folder path(s): {pipeline_settings['libraries']}")
 
-    ## Modify dictionary for specific DLT configurations
-    create_dlt_pipeline_call['name'] = pipeline_name
+    result = _create_or_update_pipeline(w, pipeline_settings, pipeline_id, upsert)
+    print(f"\nLakeflow Declarative Pipeline {'Update' if result['action'] == 'updated' else 'Creation'} '{pipeline_name}' Complete!")
+    return result['pipeline_id']
 
-    ## Set paths to root and source folders
-    main_course_folder_path = os.getcwd()
 
-    main_path_to_dlt_project_folder = os.path.join('/', main_course_folder_path, root_path_folder_name)
-    create_dlt_pipeline_call['root_path'] = main_path_to_dlt_project_folder
+def create_declarative_pipelines(pipelines: list, upsert: bool = False, max_workers: int = 8) -> list:
+    '''
+    Creates or updates many pipelines concurrently.
 
-    ## Add path of root folder to source folder names
-    add_path_to_folder_names = [os.path.join(main_path_to_dlt_project_folder, folder_name, '**') for folder_name in source_folder_names]
-    source_folders_path = [{'glob':{'include':folder_name}} for folder_name in add_path_to_folder_names]
-    create_dlt_pipeline_call['libraries'] = source_folders_path
+    The existing pipeline names are read with a single listing of the workspace, then the creates and edits run on a thread pool
+    of `max_workers` threads. A failed pipeline does not stop the others. Failures are printed and returned.
 
-    ## Set default catalog and schema
-    create_dlt_pipeline_call['catalog'] = catalog_name
-    create_dlt_pipeline_call['schema'] = schema_name
+    Parameters:
+    - pipelines (list): One dictionary of create_declarative_pipeline keyword arguments per pipeline, without upsert. schema_sources and rule_sets are supported.
+    - upsert (bool, optional): If True, pipelines that already exist are edited in place. Otherwise they fail with an error. Default is False.
+    - max_workers (int, optional): Number of creates and edits to run at the same time. Default is 8.
 
-    ## Set serverless compute
-    create_dlt_pipeline_call['serverless'] = serverless
+    Returns:
+    - list: One dictionary per pipeline with the name, pipeline id, action ('created' or 'updated'), elapsed seconds and error (None if successful).
 
-    ## Set configuration parameters
-    create_dlt_pipeline_call['configuration'] = configuration
+    Example:
+    - create_declarative_pipelines([{'pipeline_name': f'2 - Simple Pipeline - {DA.catalog_name}', 'root_path_folder_name': '2 - Developing a Simple Pipeline Project', 'source_folder_names': ['orders']},
+                                    {'pipeline_name': f'3 - Expectations - {DA.catalog_name}', 'root_path_folder_name': '3 - Adding Data Quality Expectations Project', 'source_folder_names': ['orders']}],
+                                   upsert=True)
+    '''
+    import time
+    from concurrent.futures import ThreadPoolExecutor
 
-    ## Set if continouous or not
-    create_dlt_pipeline_call['continuous'] = continuous 
+    pipeline_names = [pipeline['pipeline_name'] for pipeline in pipelines]
+    duplicate_names = {name for name in pipeline_names if pipeline_names.count(name) > 1}
+    if duplicate_names:
+        raise ValueError(f"Pipeline names must be unique in a batch. Found duplicates: {sorted(duplicate_names)}")
 
-    ## Set to use Photon
-    create_dlt_pipeline_call['photon'] = photon
+    w = WorkspaceClient()
+    existing_pipeline_ids = _list_pipeline_ids_by_name(w)
+
+    def create_or_update(pipeline: dict) -> dict:
+        start_time = time.perf_counter()
+        result = {'name': pipeline['pipeline_name'], 'pipeline_id': None, 'action': None, 'error': None}
+        try:
+            settings = dict(pipeline)
+            settings['configuration'] = _with_registry_schemas(settings.get('configuration', {}), settings.pop('schema_sources', None), settings.pop('rule_sets', None))
+            result.update(_create_or_update_pipeline(w, _pipeline_settings(**settings), existing_pipeline_ids.get(pipeline['pipeline_name']), upsert))
+        except Exception as e:
+            result['error'] = str(e)
+        result['seconds'] = time.perf_counter() - start_time
+        return result
+
+    print(f"Creating or updating {len(pipelines)} Lakeflow Declarative Pipeline(s) with up to {max_workers} concurrent requests:")
+    with ThreadPoolExecutor(max_workers = max_workers) as executor:
+        results = list(executor.map(create_or_update, pipelines))
+
+    for result in results:
+        if result['error'] is None:
+            print(f"{result['action'].capitalize()} '{result['name']}' ({result['pipeline_id']}, {result['seconds']:.2f}s)")
+        else:
+            print(f"Failed '{result['name']}': {result['error']}")
+    return results
 
-    ## Set DLT channel
-    create_dlt_pipeline_call['channel'] = channel
+# COMMAND ----------
 
-    ## Set if development mode
-    create_dlt_pipeline_call['development'] = development
+_SETUP_STATE_NAME = '.setup_state.json'
+
+
+def _hash_setup_inputs(inputs) -> str:
+    '''
+    Returns a stable SHA-256 hash of the JSON representation of the inputs of a setup step.
+    '''
+    import json
+    import hashlib
 
-    ## Creat DLT pipeline
+    return hashlib.sha256(json.dumps(inputs, sort_keys = True, default = str).encode('utf-8')).hexdigest()
 
-    print(f"Creating the Lakeflow Declarative Pipeline '{pipeline_name}'...")
-    print(f"Root folder path: {main_path_to_dlt_project_folder}")
-    print(f"Source folder path(s): {source_folders_path}")
 
-    w.api_client.do('POST', '/api/2.0/pipelines', body=create_dlt_pipeline_call)
-    print(f"\nLakeflow Declarative Pipeline Creation '{pipeline_name}' Complete!")
+def _folder_fingerprint(folders: list) -> dict:
+    '''
+    Returns the name and size of every visible file in each folder, used to check that a setup step's output was not changed since it ran.
+    Hidden files such as the copy manifest are ignored.
+    '''
+    import os
+
+    fingerprint = {}
+    for folder in folders:
+        if os.path.exists(folder):
+            with os.scandir(folder) as entries:
+                fingerprint[folder] = sorted((entry.name, entry.stat().st_size) for entry in entries if not entry.name.startswith('.'))
+        else:
+            fingerprint[folder] = None
+    return fingerprint
+
+
+def run_setup_step(step_name: str, inputs: dict, step_func: callable, state_dir: str, output_fingerprint: callable = None, force: bool = False):
+    '''
+    Runs a setup step only if it has not completed yet with the same inputs, recording its completion in a setup state file.
+
+    The state file stores, per step, the hash of the step's inputs, the completion time and optionally a fingerprint of the step's output.
+    A step is skipped when the recorded input hash matches and the output fingerprint (if given) still matches the current output.
+    Otherwise the step runs and its state is updated.
+
+    Parameters:
+    - step_name (str): Unique name of the step in the state file.
+    - inputs (dict): JSON serializable inputs of the step. Any change to the inputs re-runs the step.
+    - step_func (callable): Function without arguments that performs the step.
+    - state_dir (str): Folder where the setup state file is stored. Use DA.paths.working_dir.
+    - output_fingerprint (callable, optional): Function without arguments that returns a JSON serializable fingerprint of the step's output.
+                                               If the output was changed since the step ran, the step runs again. Default is None.
+    - force (bool, optional): If True, always runs the step. Default is False.
+
+    Returns:
+    - bool: True if the step ran, False if it was skipped.
+
+    Example:
+    - run_setup_step('create_directories', {'folders': ['orders']},
+                     lambda: create_directory_in_user_volume(DA.paths.working_dir, ['orders']),
+                     state_dir=DA.paths.working_dir)
+    '''
+    import os
+    import json
+    from datetime import datetime, timezone
+
+    state_path = os.path.join(state_dir, _SETUP_STATE_NAME)
+    state = {}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+
+    inputs_hash = _hash_setup_inputs(inputs)
+    step_state = state.get(step_name, {})
+
+    if not force and step_state.get('inputs_hash') == inputs_hash and step_state.get('completed_at'):
+        if output_fingerprint is None or step_state.get('output_hash') == _hash_setup_inputs(output_fingerprint()):
+            print(f"Setup step '{step_name}' already completed at {step_state['completed_at']} with the same inputs. Skipping step.")
+            return False
+
+    print(f"Running setup step '{step_name}'{' (forced)' if force else ''}...")
+    step_func()
+
+    state[step_name] = {
+        'inputs_hash': inputs_hash,
+        'output_hash': _hash_setup_inputs(output_fingerprint()) if output_fingerprint else None,
+        'completed_at': datetime.now(timezone.utc).isoformat()
+    }
+    with open(f'{state_path}.tmp', 'w') as f:
+        json.dump(state, f, indent = 2)
+    os.replace(f'{state_path}.tmp', state_path)
+    return True
 
 # COMMAND ----------
 
@@ -460,6 +2089,221 @@ def setup_complete():
   print('SETUP COMPLETE!')
   print('------------------------------------------------------------------------------')
 
+  if setup_instrumentation.enabled:
+      setup_instrumentation.report(json_path = globals().get('instrument_setup_report_path'))
+
+# COMMAND ----------
+
+import builtins
+import functools
+import contextvars
+
+## os functions the helpers use on /Volumes FUSE paths, counted as filesystem round-trips inside a span.
+## os.path.exists, isfile, isdir, getsize and getmtime are counted through os.stat, which they call.
+_OS_FILESYSTEM_CALLS = ['listdir', 'scandir', 'stat', 'lstat', 'link', 'replace', 'rename', 'remove', 'unlink', 'mkdir', 'makedirs', 'rmdir']
+
+
+class _RoundTripCounter:
+    """
+    Proxy around spark or dbutils that counts calls to the given methods as catalog or filesystem round-trips.
+    Attributes listed in `children` are wrapped in their own proxy (e.g. dbutils.fs).
+    """
+
+    def __init__(self, target, instrumentation, kind: str, methods: set, children: dict = None):
+        self._target = target
+        self._instrumentation = instrumentation
+        self._kind = kind
+        self._methods = methods
+        self._children = children or {}
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name in self._children:
+            return _RoundTripCounter(attribute, self._instrumentation, self._kind, self._children[name])
+        if name in self._methods:
+            return self._instrumentation._counted(self._kind, attribute)
+        return attribute
+
+
+class SetupInstrumentation:
+    """
+    Opt-in timing spans for the classroom setup helpers.
+
+    `enable` wraps the setup helper functions and the LabDataSetup methods with spans, and wraps spark and dbutils to count
+    catalog (spark.sql) and filesystem (dbutils.fs) round-trips. Calls to open and to the os functions in _OS_FILESYSTEM_CALLS
+    made inside a span also count as filesystem round-trips, since most helpers work on the /Volumes FUSE paths directly.
+    A span is tracked with a context variable, so os and open calls from other threads are not counted; the helpers run their
+    worker threads in a copy of the caller's context. A call made inside another counted call (e.g. os.stat inside os.makedirs)
+    is not counted again. Listing a folder with os.scandir counts once; DirEntry.stat calls are not counted. Each span records
+    the number of calls, the wall time and the round-trips made while it was running, including nested helpers.
+    `report` prints a summary table and returns (and optionally writes) the same data as JSON. `disable` restores the
+    original helpers, spark, dbutils, os functions and open.
+
+    Set `instrument_setup = True` before running a setup notebook to enable it. setup_complete() prints the report and
+    writes it to `instrument_setup_report_path` if that variable is set.
+
+    Example:
+      setup_instrumentation.enable()
+      copy_files(...)
+      setup_instrumentation.report(json_path=f'{DA.paths.working_dir}/setup_report.json')
+      setup_instrumentation.disable()
+    """
+
+    INSTRUMENTED_FUNCTIONS = [
+        'create_volume', 'create_schemas', 'check_if_schemas_are_created', 'delete_source_files', 'copy_files',
+        'simulate_file_arrival', 'copy_file_for_multiple_sources', 'create_directory_in_user_volume', 'drop_tables',
+        'coalesce_landing_files', 'create_declarative_pipeline', 'create_declarative_pipelines', 'run_setup_step',
+        'create_country_lookup_table'
+    ]
+    INSTRUMENTED_CLASSES = ['LabDataSetup']
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = {}
+        self.round_trips = {'catalog': 0, 'filesystem': 0}
+        self._lock = threading.Lock()
+        self._in_span = contextvars.ContextVar('setup_instrumentation_in_span', default = False)
+        self._thread_state = threading.local()
+
+    def add_round_trip(self, kind: str):
+        with self._lock:
+            self.round_trips[kind] = self.round_trips[kind] + 1
+
+    def _counted(self, kind: str, func: callable, spans_only: bool = False) -> callable:
+        '''
+        Wraps func to count each call as a round-trip. Calls made inside another counted call on the same thread are not counted.
+        With spans_only, calls are only counted inside a span (in the current context).
+        '''
+        @functools.wraps(func)
+        def counted(*args, **kwargs):
+            if getattr(self._thread_state, 'counting', False) or (spans_only and not self._in_span.get()):
+                return func(*args, **kwargs)
+            self.add_round_trip(kind)
+            self._thread_state.counting = True
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._thread_state.counting = False
+
+        counted._instrumented = True
+        return counted
+
+    def _wrap(self, span_name: str, func: callable) -> callable:
+        @functools.wraps(func)
+        def instrumented(*args, **kwargs):
+            with self._lock:
+                start_round_trips = dict(self.round_trips)
+            token = self._in_span.set(True)
+            start_time = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start_time
+                self._in_span.reset(token)
+                with self._lock:
+                    span = self.spans.setdefault(span_name, {'calls': 0, 'seconds': 0.0, 'catalog_round_trips': 0, 'filesystem_round_trips': 0})
+                    span['calls'] = span['calls'] + 1
+                    span['seconds'] = span['seconds'] + elapsed
+                    span['catalog_round_trips'] = span['catalog_round_trips'] + self.round_trips['catalog'] - start_round_trips['catalog']
+                    span['filesystem_round_trips'] = span['filesystem_round_trips'] + self.round_trips['filesystem'] - start_round_trips['filesystem']
+
+        instrumented._instrumented = True
+        return instrumented
+
+    def enable(self):
+        '''
+        Wraps the setup helpers that are currently defined. Safe to call again after a %run redefines them.
+        '''
+        namespace = globals()
+        self.enabled = True
+
+        for name in self.INSTRUMENTED_FUNCTIONS:
+            func = namespace.get(name)
+            if callable(func) and not getattr(func, '_instrumented', False):
+                namespace[name] = self._wrap(name, func)
+
+        for class_name in self.INSTRUMENTED_CLASSES:
+            cls = namespace.get(class_name)
+            if cls is None:
+                continue
+            for attribute_name, attribute in list(vars(cls).items()):
+                if callable(attribute) and (attribute_name == '__init__' or not attribute_name.startswith('__')) and not getattr(attribute, '_instrumented', False):
+                    setattr(cls, attribute_name, self._wrap(f'{class_name}.{attribute_name}', attribute))
+
+        ## Compare by class name since a %run of this notebook redefines the _RoundTripCounter class
+        if type(namespace['spark']).__name__ != '_RoundTripCounter':
+            namespace['spark'] = _RoundTripCounter(namespace['spark'], self, 'catalog', {'sql'})
+        if type(namespace['dbutils']).__name__ != '_RoundTripCounter':
+            namespace['dbutils'] = _RoundTripCounter(namespace['dbutils'], self, 'filesystem', set(),
+                                                     children = {'fs': {'cp', 'mv', 'rm', 'ls', 'mkdirs', 'head', 'put'}})
+
+        ## Count the os and open calls the helpers make on the FUSE paths. These are patched for the whole process, so they
+        ## only count inside a span; disable() restores them.
+        for name in _OS_FILESYSTEM_CALLS:
+            if not getattr(getattr(os, name), '_instrumented', False):
+                setattr(os, name, self._counted('filesystem', getattr(os, name), spans_only = True))
+        if not getattr(builtins.open, '_instrumented', False):
+            builtins.open = self._counted('filesystem', builtins.open, spans_only = True)
+
+    def disable(self):
+        '''
+        Restores the original setup helpers, spark, dbutils, os functions and open. The collected spans are kept for report().
+        '''
+        namespace = globals()
+        self.enabled = False
+
+        for name in self.INSTRUMENTED_FUNCTIONS:
+            func = namespace.get(name)
+            if getattr(func, '_instrumented', False):
+                namespace[name] = func.__wrapped__
+
+        for class_name in self.INSTRUMENTED_CLASSES:
+            cls = namespace.get(class_name)
+            if cls is None:
+                continue
+            for attribute_name, attribute in list(vars(cls).items()):
+                if getattr(attribute, '_instrumented', False):
+                    setattr(cls, attribute_name, attribute.__wrapped__)
+
+        for name in ('spark', 'dbutils'):
+            if type(namespace[name]).__name__ == '_RoundTripCounter':
+                namespace[name] = namespace[name]._target
+
+        for name in _OS_FILESYSTEM_CALLS:
+            if getattr(getattr(os, name), '_instrumented', False):
+                setattr(os, name, getattr(os, name).__wrapped__)
+        if getattr(builtins.open, '_instrumented', False):
+            builtins.open = builtins.open.__wrapped__
+
+    def report(self, json_path: str = None) -> dict:
+        '''
+        Prints the spans sorted by total wall time and returns them as a dictionary. If json_path is set, also writes the report as JSON.
+        '''
+        import json
+
+        with self._lock:
+            report = {'round_trips': dict(self.round_trips), 'spans': {name: dict(span) for name, span in self.spans.items()}}
+
+        print(f"\n{'Span':<45}{'Calls':>7}{'Total (s)':>12}{'Avg (s)':>10}{'Catalog':>9}{'FS':>7}")
+        for name, span in sorted(report['spans'].items(), key = lambda item: item[1]['seconds'], reverse = True):
+            print(f"{name:<45}{span['calls']:>7}{span['seconds']:>12.3f}{span['seconds'] / span['calls']:>10.3f}{span['catalog_round_trips']:>9}{span['filesystem_round_trips']:>7}")
+        print(f"Total round-trips: {report['round_trips']['catalog']} catalog, {report['round_trips']['filesystem']} filesystem.")
+
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump(report, f, indent = 2)
+            print(f'Instrumentation report written to {json_path}.')
+        return report
+
+
+## Keep the collected spans across %run chains in the same session
+if 'setup_instrumentation' not in globals():
+    setup_instrumentation = SetupInstrumentation()
+
+## Set instrument_setup = True before running a setup notebook to time the setup helpers
+if globals().get('instrument_setup', False):
+    setup_instrumentation.enable()
+
 # COMMAND ----------
 
 # @DBAcademyHelper.add_method
@@ -3,241 +3,352 @@
 
 # COMMAND ----------
 
-def create_country_lookup_table(in_catalog: str, in_schema: str):
-    # List of country abbreviations and names
-    country_data = [
-        ('AF', 'Afghanistan'),
-        ('AL', 'Albania'),
-        ('DZ', 'Algeria'),
-        ('AS', 'American Samoa'),
-        ('AD', 'Andorra'),
-        ('AO', 'Angola'),
-        ('AI', 'Anguilla'),
-        ('AQ', 'Antarctica'),
-        ('AR', 'Argentina'),
-        ('AM', 'Armenia'),
-        ('AW', 'Aruba'),
-        ('AU', 'Australia'),
-        ('AT', 'Austria'),
-        ('AZ', 'Azerbaijan'),
-        ('BS', 'Bahamas'),
-        ('BH', 'Bahrain'),
-        ('BD', 'Bangladesh'),
-        ('BB', 'Barbados'),
-        ('BY', 'Belarus'),
-        ('BE', 'Belgium'),
-        ('BZ', 'Belize'),
-        ('BJ', 'Benin'),
-        ('BM', 'Bermuda'),
-        ('BT', 'Bhutan'),
-        ('BO', 'Bolivia'),
-        ('BA', 'Bosnia and Herzegovina'),
-        ('BW', 'Botswana'),
-        ('BR', 'Brazil'),
-        ('BN', 'Brunei Darussalam'),
-        ('BG', 'Bulgaria'),
-        ('BF', 'Burkina Faso'),
-        ('BI', 'Burundi'),
-        ('KH', 'Cambodia'),
-        ('CM', 'Cameroon'),
-        ('CA', 'Canada'),
-        ('CV', 'Cape Verde'),
-        ('KY', 'Cayman Islands'),
-        ('CF', 'Central African Republic'),
-        ('TD', 'Chad'),
-        ('CL', 'Chile'),
-        ('CN', 'China'),
-        ('CO', 'Colombia'),
-        ('KM', 'Comoros'),
-        ('CG', 'Congo'),
-        ('CD', 'Democratic Republic of the Congo'),
-        ('CK', 'Cook Islands'),
-        ('CR', 'Costa Rica'),
-        ('CI', 'Côte d\'Ivoire'),
-        ('HR', 'Croatia'),
-        ('CU', 'Cuba'),
-        ('CY', 'Cyprus'),
-        ('CZ', 'Czech Republic'),
-        ('DK', 'Denmark'),
-        ('DJ', 'Djibouti'),
-        ('DM', 'Dominica'),
-        ('DO', 'Dominican Republic'),
-        ('EC', 'Ecuador'),
-        ('EG', 'Egypt'),
-        ('SV', 'El Salvador'),
-        ('GQ', 'Equatorial Guinea'),
-        ('ER', 'Eritrea'),
-        ('EE', 'Estonia'),
-        ('ET', 'Ethiopia'),
-        ('FK', 'Falkland Islands'),
-        ('FO', 'Faroe Islands'),
-        ('FJ', 'Fiji'),
-        ('FI', 'Finland'),
-        ('FR', 'France'),
-        ('GA', 'Gabon'),
-        ('GM', 'Gambia'),
-        ('GE', 'Georgia'),
-        ('DE', 'Germany'),
-        ('GH', 'Ghana'),
-        ('GI', 'Gibraltar'),
-        ('GR', 'Greece'),
-        ('GL', 'Greenland'),
-        ('GD', 'Grenada'),
-        ('GP', 'Guadeloupe'),
-        ('GU', 'Guam'),
-        ('GT', 'Guatemala'),
-        ('GN', 'Guinea'),
-        ('GW', 'Guinea-Bissau'),
-        ('GY', 'Guyana'),
-        ('HT', 'Haiti'),
-        ('HM', 'Heard Island and McDonald Islands'),
-        ('HN', 'Honduras'),
-        ('HK', 'Hong Kong'),
-        ('HU', 'Hungary'),
-        ('IS', 'Iceland'),
-        ('IN', 'India'),
-        ('ID', 'Indonesia'),
-        ('IR', 'Iran'),
-        ('IQ', 'Iraq'),
-        ('IE', 'Ireland'),
-        ('IL', 'Israel'),
-        ('IT', 'Italy'),
-        ('JM', 'Jamaica'),
-        ('JP', 'Japan'),
-        ('JO', 'Jordan'),
-        ('KZ', 'Kazakhstan'),
-        ('KE', 'Kenya'),
-        ('KI', 'Kiribati'),
-        ('KP', 'North Korea'),
-        ('KR', 'South Korea'),
-        ('KW', 'Kuwait'),
-        ('KG', 'Kyrgyzstan'),
-        ('LA', 'Laos'),
-        ('LV', 'Latvia'),
-        ('LB', 'Lebanon'),
-        ('LS', 'Lesotho'),
-        ('LR', 'Liberia'),
-        ('LY', 'Libya'),
-        ('LI', 'Liechtenstein'),
-        ('LT', 'Lithuania'),
-        ('LU', 'Luxembourg'),
-        ('MO', 'Macao'),
-        ('MK', 'North Macedonia'),
-        ('MG', 'Madagascar'),
-        ('MW', 'Malawi'),
-        ('MY', 'Malaysia'),
-        ('MV', 'Maldives'),
-        ('ML', 'Mali'),
-        ('MT', 'Malta'),
-        ('MH', 'Marshall Islands'),
-        ('MQ', 'Martinique'),
-        ('MR', 'Mauritania'),
-        ('MU', 'Mauritius'),
-        ('YT', 'Mayotte'),
-        ('MX', 'Mexico'),
-        ('FM', 'Federated States of Micronesia'),
-        ('MD', 'Moldova'),
-        ('MC', 'Monaco'),
-        ('MN', 'Mongolia'),
-        ('ME', 'Montenegro'),
-        ('MS', 'Montserrat'),
-        ('MA', 'Morocco'),
-        ('MZ', 'Mozambique'),
-        ('MM', 'Myanmar (Burma)'),
-        ('NA', 'Namibia'),
-        ('NR', 'Nauru'),
-        ('NP', 'Nepal'),
-        ('NL', 'Netherlands'),
-        ('NC', 'New Caledonia'),
-        ('NZ', 'New Zealand'),
-        ('NI', 'Nicaragua'),
-        ('NE', 'Niger'),
-        ('NG', 'Nigeria'),
-        ('NU', 'Niue'),
-        ('NF', 'Norfolk Island'),
-        ('MP', 'Northern Mariana Islands'),
-        ('NO', 'Norway'),
-        ('OM', 'Oman'),
-        ('PK', 'Pakistan'),
-        ('PW', 'Palau'),
-        ('PS', 'Palestine'),
-        ('PA', 'Panama'),
-        ('PG', 'Papua New Guinea'),
-        ('PY', 'Paraguay'),
-        ('PE', 'Peru'),
-        ('PH', 'Philippines'),
-        ('PN', 'Pitcairn Islands'),
-        ('PL', 'Poland'),
-        ('PT', 'Portugal'),
-        ('PR', 'Puerto Rico'),
-        ('QA', 'Qatar'),
-        ('RE', 'Réunion'),
-        ('RO', 'Romania'),
-        ('RU', 'Russia'),
-        ('RW', 'Rwanda'),
-        ('SA', 'Saudi Arabia'),
-        ('SN', 'Senegal'),
-        ('RS', 'Serbia'),
-        ('SC', 'Seychelles'),
-        ('SL', 'Sierra Leone'),
-        ('SG', 'Singapore'),
-        ('SX', 'Sint Maarten'),
-        ('SK', 'Slovakia'),
-        ('SI', 'Slovenia'),
-        ('SB', 'Solomon Islands'),
-        ('SO', 'Somalia'),
-        ('ZA', 'South Africa'),
-        ('SS', 'South Sudan'),
-        ('ES', 'Spain'),
-        ('LK', 'Sri Lanka'),
-        ('SD', 'Sudan'),
-        ('SR', 'Suriname'),
-        ('SJ', 'Svalbard and Jan Mayen'),
-        ('SZ', 'Swaziland'),
-        ('SE', 'Sweden'),
-        ('CH', 'Switzerland'),
-        ('SY', 'Syria'),
-        ('TW', 'Taiwan'),
-        ('TJ', 'Tajikistan'),
-        ('TZ', 'Tanzania'),
-        ('TH', 'Thailand'),
-        ('TL', 'Timor-Leste'),
-        ('TG', 'Togo'),
-        ('TK', 'Tokelau'),
-        ('TO', 'Tonga'),
-        ('TT', 'Trinidad and Tobago'),
-        ('TN', 'Tunisia'),
-        ('TR', 'Turkey'),
-        ('TM', 'Turkmenistan'),
-        ('TC', 'Turks and Caicos Islands'),
-        ('TV', 'Tuvalu'),
-        ('UG', 'Uganda'),
-        ('UA', 'Ukraine'),
-        ('AE', 'United Arab Emirates'),
-        ('GB', 'United Kingdom'),
-        ('US', 'United States'),
-        ('UY', 'Uruguay'),
-        ('UZ', 'Uzbekistan'),
-        ('VU', 'Vanuatu'),
-        ('VA', 'Vatican City'),
-        ('VE', 'Venezuela'),
-        ('VN', 'Vietnam'),
-        ('WF', 'Wallis and Futuna'),
-        ('YE', 'Yemen'),
-        ('ZM', 'Zambia'),
-        ('ZW', 'Zimbabwe')
-    ]
-
-    # Convert the list into a Spark DataFrame
-    df_country = spark.createDataFrame(country_data, ['country_abbreviation', 'country_name'])
-
-    # Show the DataFrame
-    df_country.write.mode("overwrite").saveAsTable(f"{in_catalog}.{in_schema}.country_lookup")
+## COUNTRY_LOOKUP REFERENCE DATA
+##
+## Bump COUNTRY_LOOKUP_VERSION when the list changes. create_country_lookup_table stores a content hash of the version and rows as a
+## table property and only rewrites the table when the hash changes. It also creates the country_lookup_broadcast view, which
+## pipelines join against to broadcast the table.
+COUNTRY_LOOKUP_VERSION = 1
+
+# List of country abbreviations and names
+COUNTRY_LOOKUP_DATA = [
+    ('AF', 'Afghanistan'),
+    ('AL', 'Albania'),
+    ('DZ', 'Algeria'),
+    ('AS', 'American Samoa'),
+    ('AD', 'Andorra'),
+    ('AO', 'Angola'),
+    ('AI', 'Anguilla'),
+    ('AQ', 'Antarctica'),
+    ('AR', 'Argentina'),
+    ('AM', 'Armenia'),
+    ('AW', 'Aruba'),
+    ('AU', 'Australia'),
+    ('AT', 'Austria'),
+    ('AZ', 'Azerbaijan'),
+    ('BS', 'Bahamas'),
+    ('BH', 'Bahrain'),
+    ('BD', 'Bangladesh'),
+    ('BB', 'Barbados'),
+    ('BY', 'Belarus'),
+    ('BE', 'Belgium'),
+    ('BZ', 'Belize'),
+    ('BJ', 'Benin'),
+    ('BM', 'Bermuda'),
+    ('BT', 'Bhutan'),
+    ('BO', 'Bolivia'),
+    ('BA', 'Bosnia and Herzegovina'),
+    ('BW', 'Botswana'),
+    ('BR', 'Brazil'),
+    ('BN', 'Brunei Darussalam'),
+    ('BG', 'Bulgaria'),
+    ('BF', 'Burkina Faso'),
+    ('BI', 'Burundi'),
+    ('KH', 'Cambodia'),
+    ('CM', 'Cameroon'),
+    ('CA', 'Canada'),
+    ('CV', 'Cape Verde'),
+    ('KY', 'Cayman Islands'),
+    ('CF', 'Central African Republic'),
+    ('TD', 'Chad'),
+    ('CL', 'Chile'),
+    ('CN', 'China'),
+    ('CO', 'Colombia'),
+    ('KM', 'Comoros'),
+    ('CG', 'Congo'),
+    ('CD', 'Democratic Republic of the Congo'),
+    ('CK', 'Cook Islands'),
+    ('CR', 'Costa Rica'),
+    ('CI', 'Côte d\'Ivoire'),
+    ('HR', 'Croatia'),
+    ('CU', 'Cuba'),
+    ('CY', 'Cyprus'),
+    ('CZ', 'Czech Republic'),
+    ('DK', 'Denmark'),
+    ('DJ', 'Djibouti'),
+    ('DM', 'Dominica'),
+    ('DO', 'Dominican Republic'),
+    ('EC', 'Ecuador'),
+    ('EG', 'Egypt'),
+    ('SV', 'El Salvador'),
+    ('GQ', 'Equatorial Guinea'),
+    ('ER', 'Eritrea'),
+    ('EE', 'Estonia'),
+    ('ET', 'Ethiopia'),
+    ('FK', 'Falkland Islands'),
+    ('FO', 'Faroe Islands'),
+    ('FJ', 'Fiji'),
+    ('FI', 'Finland'),
+    ('FR', 'France'),
+    ('GA', 'Gabon'),
+    ('GM', 'Gambia'),
+    ('GE', 'Georgia'),
+    ('DE', 'Germany'),
+    ('GH', 'Ghana'),
+    ('GI', 'Gibraltar'),
+    ('GR', 'Greece'),
+    ('GL', 'Greenland'),
+    ('GD', 'Grenada'),
+    ('GP', 'Guadeloupe'),
+    ('GU', 'Guam'),
+    ('GT', 'Guatemala'),
+    ('GN', 'Guinea'),
+    ('GW', 'Guinea-Bissau'),
+    ('GY', 'Guyana'),
+    ('HT', 'Haiti'),
+    ('HM', 'Heard Island and McDonald Islands'),
+    ('HN', 'Honduras'),
+    ('HK', 'Hong Kong'),
+    ('HU', 'Hungary'),
+    ('IS', 'Iceland'),
+    ('IN', 'India'),
+    ('ID', 'Indonesia'),
+    ('IR', 'Iran'),
+    ('IQ', 'Iraq'),
+    ('IE', 'Ireland'),
+    ('IL', 'Israel'),
+    ('IT', 'Italy'),
+    ('JM', 'Jamaica'),
+    ('JP', 'Japan'),
+    ('JO', 'Jordan'),
+    ('KZ', 'Kazakhstan'),
+    ('KE', 'Kenya'),
+    ('KI', 'Kiribati'),
+    ('KP', 'North Korea'),
+    ('KR', 'South Korea'),
+    ('KW', 'Kuwait'),
+    ('KG', 'Kyrgyzstan'),
+    ('LA', 'Laos'),
+    ('LV', 'Latvia'),
+    ('LB', 'Lebanon'),
+    ('LS', 'Lesotho'),
+    ('LR', 'Liberia'),
+    ('LY', 'Libya'),
+    ('LI', 'Liechtenstein'),
+    ('LT', 'Lithuania'),
+    ('LU', 'Luxembourg'),
+    ('MO', 'Macao'),
+    ('MK', 'North Macedonia'),
+    ('MG', 'Madagascar'),
+    ('MW', 'Malawi'),
+    ('MY', 'Malaysia'),
+    ('MV', 'Maldives'),
+    ('ML', 'Mali'),
+    ('MT', 'Malta'),
+    ('MH', 'Marshall Islands'),
+    ('MQ', 'Martinique'),
+    ('MR', 'Mauritania'),
+    ('MU', 'Mauritius'),
+    ('YT', 'Mayotte'),
+    ('MX', 'Mexico'),
+    ('FM', 'Federated States of Micronesia'),
+    ('MD', 'Moldova'),
+    ('MC', 'Monaco'),
+    ('MN', 'Mongolia'),
+    ('ME', 'Montenegro'),
+    ('MS', 'Montserrat'),
+    ('MA', 'Morocco'),
+    ('MZ', 'Mozambique'),
+    ('MM', 'Myanmar (Burma)'),
+    ('NA', 'Namibia'),
+    ('NR', 'Nauru'),
+    ('NP', 'Nepal'),
+    ('NL', 'Netherlands'),
+    ('NC', 'New Caledonia'),
+    ('NZ', 'New Zealand'),
+    ('NI', 'Nicaragua'),
+    ('NE', 'Niger'),
+    ('NG', 'Nigeria'),
+    ('NU', 'Niue'),
+    ('NF', 'Norfolk Island'),
+    ('MP', 'Northern Mariana Islands'),
+    ('NO', 'Norway'),
+    ('OM', 'Oman'),
+    ('PK', 'Pakistan'),
+    ('PW', 'Palau'),
+    ('PS', 'Palestine'),
+    ('PA', 'Panama'),
+    ('PG', 'Papua New Guinea'),
+    ('PY', 'Paraguay'),
+    ('PE', 'Peru'),
+    ('PH', 'Philippines'),
+    ('PN', 'Pitcairn Islands'),
+    ('PL', 'Poland'),
+    ('PT', 'Portugal'),
+    ('PR', 'Puerto Rico'),
+    ('QA', 'Qatar'),
+    ('RE', 'Réunion'),
+    ('RO', 'Romania'),
+    ('RU', 'Russia'),
+    ('RW', 'Rwanda'),
+    ('SA', 'Saudi Arabia'),
+    ('SN', 'Senegal'),
+    ('RS', 'Serbia'),
+    ('SC', 'Seychelles'),
+    ('SL', 'Sierra Leone'),
+    ('SG', 'Singapore'),
+    ('SX', 'Sint Maarten'),
+    ('SK', 'Slovakia'),
+    ('SI', 'Slovenia'),
+    ('SB', 'Solomon Islands'),
+    ('SO', 'Somalia'),
+    ('ZA', 'South Africa'),
+    ('SS', 'South Sudan'),
+    ('ES', 'Spain'),
+    ('LK', 'Sri Lanka'),
+    ('SD', 'Sudan'),
+    ('SR', 'Suriname'),
+    ('SJ', 'Svalbard and Jan Mayen'),
+    ('SZ', 'Swaziland'),
+    ('SE', 'Sweden'),
+    ('CH', 'Switzerland'),
+    ('SY', 'Syria'),
+    ('TW', 'Taiwan'),
+    ('TJ', 'Tajikistan'),
+    ('TZ', 'Tanzania'),
+    ('TH', 'Thailand'),
+    ('TL', 'Timor-Leste'),
+    ('TG', 'Togo'),
+    ('TK', 'Tokelau'),
+    ('TO', 'Tonga'),
+    ('TT', 'Trinidad and Tobago'),
+    ('TN', 'Tunisia'),
+    ('TR', 'Turkey'),
+    ('TM', 'Turkmenistan'),
+    ('TC', 'Turks and Caicos Islands'),
+    ('TV', 'Tuvalu'),
+    ('UG', 'Uganda'),
+    ('UA', 'Ukraine'),
+    ('AE', 'United Arab Emirates'),
+    ('GB', 'United Kingdom'),
+    ('US', 'United States'),
+    ('UY', 'Uruguay'),
+    ('UZ', 'Uzbekistan'),
+    ('VU', 'Vanuatu'),
+    ('VA', 'Vatican City'),
+    ('VE', 'Venezuela'),
+    ('VN', 'Vietnam'),
+    ('WF', 'Wallis and Futuna'),
+    ('YE', 'Yemen'),
+    ('ZM', 'Zambia'),
+    ('ZW', 'Zimbabwe')
+]
+
+COUNTRY_LOOKUP_HASH_PROPERTY = 'dbacademy.content_hash'
+COUNTRY_LOOKUP_BROADCAST_VIEW = 'country_lookup_broadcast'
+
+## Broadcast-hinted country_lookup DataFrames by table name and stored content hash, kept across %run chains
+if '_country_lookup_dimensions' not in globals():
+    _country_lookup_dimensions = {}
+
+
+def _country_lookup_rows(extra_countries: list = None) -> list:
+    '''
+    Returns the country_lookup rows sorted by abbreviation. extra_countries are added, or replace a country with the same abbreviation.
+    '''
+    countries = dict(COUNTRY_LOOKUP_DATA)
+    countries.update(dict(extra_countries or []))
+    return sorted(countries.items())
+
+
+def _reference_data_hash(version: int, rows: list) -> str:
+    '''
+    Returns the SHA-256 content hash of a versioned reference data set.
+    '''
+    import json
+    import hashlib
+
+    return hashlib.sha256(json.dumps({'version': version, 'rows': rows}).encode('utf-8')).hexdigest()
+
+
+def create_country_lookup_table(in_catalog: str, in_schema: str, extra_countries: list = None, force: bool = False) -> bool:
+    '''
+    Creates or refreshes the country_lookup table from COUNTRY_LOOKUP_DATA.
+
+    The content hash of the reference data is stored in the 'dbacademy.content_hash' table property. The table is only rewritten when
+    it is missing or its stored hash differs from the current data, so rerunning the setup does not rewrite an unchanged table.
+
+    The country_lookup_broadcast view is created next to the table. It selects the table with a BROADCAST hint, so a pipeline that
+    joins against the view broadcasts the lookup instead of shuffling it:
+
+      SELECT e.*, c.country_name FROM employees_bronze e LEFT JOIN country_lookup_broadcast c ON upper(e.Country) = c.country_abbreviation
+
+    Parameters:
+    - in_catalog (str): The catalog of the table.
+    - in_schema (str): The schema of the table.
+    - extra_countries (list, optional): Additional (abbreviation, name) tuples to add to or override the reference data. Default is None.
+    - force (bool, optional): Rewrite the table even if the hash matches. Default is False.
+
+    Returns:
+    - bool: True if the table was written, False if it was already current.
+
+    Example:
+    - create_country_lookup_table(in_catalog=DA.catalog_name, in_schema='default', extra_countries=[('XK', 'Kosovo')])
+    '''
+    table_name = f"{in_catalog}.{in_schema}.country_lookup"
+    rows = _country_lookup_rows(extra_countries)
+    content_hash = _reference_data_hash(COUNTRY_LOOKUP_VERSION, rows)
+    existing_tables = catalog_metadata_cache.tables(in_catalog, in_schema)
+
+    is_current = False
+    if not force and 'country_lookup' in existing_tables:
+        properties = {row.key: row.value for row in spark.sql(f"SHOW TBLPROPERTIES {table_name}").collect()}
+        is_current = properties.get(COUNTRY_LOOKUP_HASH_PROPERTY) == content_hash
+
+    if is_current:
+        print(f'Table {table_name} is current (version {COUNTRY_LOOKUP_VERSION}). No action taken')
+    else:
+        # Convert the list into a Spark DataFrame and replace the table with the content hash in one write
+        df_country = spark.createDataFrame(rows, ['country_abbreviation', 'country_name'])
+        (df_country.writeTo(table_name)
+                   .tableProperty(COUNTRY_LOOKUP_HASH_PROPERTY, content_hash)
+                   .tableProperty('dbacademy.reference_version', str(COUNTRY_LOOKUP_VERSION))
+                   .createOrReplace())
+        print(f'Wrote {len(rows)} rows to {table_name} (version {COUNTRY_LOOKUP_VERSION}).')
+
+    ## Broadcast-hinted view for pipeline joins. It reads the table by name, so it is only created once, after the table exists.
+    if COUNTRY_LOOKUP_BROADCAST_VIEW not in existing_tables:
+        spark.sql(f"""CREATE OR REPLACE VIEW {in_catalog}.{in_schema}.{COUNTRY_LOOKUP_BROADCAST_VIEW} AS
+                      SELECT /*+ BROADCAST(country_lookup) */ country_abbreviation, country_name FROM {table_name} AS country_lookup""")
+        print(f'Created view {in_catalog}.{in_schema}.{COUNTRY_LOOKUP_BROADCAST_VIEW}.')
+
+    if not is_current or COUNTRY_LOOKUP_BROADCAST_VIEW not in existing_tables:
+        catalog_metadata_cache.invalidate(catalog = in_catalog, kind = 'tables')
+    return not is_current
+
+
+def get_country_lookup_dimension(in_catalog: str, in_schema: str):
+    '''
+    Returns the country_lookup table as a broadcast-hinted DataFrame to join against in notebooks.
+
+    The DataFrame reads the table, so it always matches the data the pipelines join against. It is cached for the session by the
+    'dbacademy.content_hash' table property, so it is only rebuilt after create_country_lookup_table rewrites the table.
+    Pipelines join against the country_lookup_broadcast view instead (see create_country_lookup_table).
+
+    Raises a ValueError if the table has no content hash, i.e. it was not written by create_country_lookup_table.
+
+    Example:
+    - employees.join(get_country_lookup_dimension(DA.catalog_name, 'default'), F.upper('Country') == F.col('country_abbreviation'), 'left')
+    '''
+    from pyspark.sql import functions as F
+
+    table_name = f"{in_catalog}.{in_schema}.country_lookup"
+    properties = {row.key: row.value for row in spark.sql(f"SHOW TBLPROPERTIES {table_name}").collect()}
+    content_hash = properties.get(COUNTRY_LOOKUP_HASH_PROPERTY)
+    if content_hash is None:
+        raise ValueError(f"Table {table_name} has no '{COUNTRY_LOOKUP_HASH_PROPERTY}' property. Run create_country_lookup_table first.")
+
+    key = (table_name, content_hash)
+    if key not in _country_lookup_dimensions:
+        _country_lookup_dimensions[key] = F.broadcast(spark.read.table(table_name))
+    return _country_lookup_dimensions[key]
 
 # COMMAND ----------
 
 import os  
-import pandas as pd
+import csv
+import random
+import itertools
 from io import StringIO
 
 class LabDataSetup:
@@ -245,16 +356,19 @@ class LabDataSetup:
     Sets up lab data by checking for the existence of a catalog, schema, volume and creating the CSV files in a staging volume.
 
     - Catalog, schema and volume must already exist.
+    - If a VolumeFileIndex of the volume path is passed as file_index, the staging files are looked up in the index and the index is saved
+      at the end of the setup.
 
     Example:
       obj = LabDataSetup('dbacademy_peter_s','default','lab_staging_files')
     """
 
-    def __init__(self, catalog_name: str, schema_name: str, volume_name: str):
+    def __init__(self, catalog_name: str, schema_name: str, volume_name: str, file_index = None):
         self.catalog_name = catalog_name
         self.schema_name = schema_name
         self.volume_name = volume_name
         self.volume_path = os.path.join('/Volumes', self.catalog_name, self.schema_name, self.volume_name)
+        self.file_index = file_index
 
         print("Starting environment validation...")
         self._validate_environment()
@@ -268,17 +382,22 @@ class LabDataSetup:
         for filename, filefunc in dict_of_files.items():
             self.create_csv_file_if_not_exists(file_name=filename, csv_data_func=filefunc)
 
+        ## Save the index once the staging files are in place
+        if self.file_index is not None:
+            self.file_index.save()
+
         print(f"LabDataSetup initialized successfully in volume_path: '{self.volume_path}'")
 
     def _validate_environment(self):
+        ## Resolve the catalog, schema and volume in one metadata query
+        self._path_exists = catalog_metadata_cache.volume_path(self.catalog_name, self.schema_name, self.volume_name)
+        self._volume_files = None
         self._validate_catalog()
         self._validate_schema()
         self._validate_volume()
 
     def _validate_catalog(self):
-        catalogs = spark.sql("SHOW CATALOGS").collect()
-        catalog_names = [row.catalog for row in catalogs]
-        if self.catalog_name in catalog_names:
+        if self._path_exists['catalog']:
             print(f"Catalog '{self.catalog_name}' exists.")
         else:
             print(f"Catalog '{self.catalog_name}' does not exist.")
@@ -286,35 +405,66 @@ class LabDataSetup:
 
     def _validate_schema(self):
         full_schema_name = f"{self.catalog_name}.{self.schema_name}"
-        if spark.catalog.databaseExists(full_schema_name):
+        if self._path_exists['schema']:
             print(f"Schema '{full_schema_name}' exists.")
         else:
             print(f"Schema '{full_schema_name}' does not exist.")
             raise FileNotFoundError(f"{full_schema_name} schema not found.")
 
     def _validate_volume(self):
-        volumes = spark.sql(f"SHOW VOLUMES IN {self.catalog_name}.{self.schema_name}").collect()
-        volume_names = [v.volume_name for v in volumes]
-        if self.volume_name in volume_names:
+        if self._path_exists['volume']:
             print(f"Volume '{self.volume_name}' exists.")
         else:
             print(f"Volume '{self.volume_name}' does not exist.")
             raise FileNotFoundError(f"{self.volume_name} volume not found.")
 
     def check_if_file_exists(self, file_name: str) -> bool:
+        ## The volume is listed once and the listing is kept up to date by the methods that write or delete staging files
+        if self._volume_files is None and self.file_index is not None and self._path_exists['volume']:
+            self.file_index.refresh(folder=self.volume_path)
+            self._volume_files = {os.path.basename(path) for path, _, _, _ in self.file_index.files(self.file_index.relative_path(self.volume_path))}
+        elif self._volume_files is None:
+            self._volume_files = set(os.listdir(self.volume_path)) if self._path_exists['volume'] else set()
+
         file_path = os.path.join(self.volume_path, file_name)
-        if os.path.exists(file_path):
+        if file_name in self._volume_files:
             print(f"The file '{file_path}' exists.")
             return True
         else:
             print(f"The file '{file_path}' does not exist.")
             return False
 
-    def create_csv_file(self, csv_string: str, file_to_create: str):
-        df = pd.read_csv(StringIO(csv_string))
+    def write_csv_rows(self, file_to_create: str, header: list, rows) -> int:
+        """
+        Streams rows from any iterable or generator to a CSV file in the volume and returns the number of rows written.
+
+        Rows are written as they are produced, so the file size is not limited by memory. The file is written as a hidden partial
+        file and renamed when complete, so read_files never picks up a partially written file.
+        """
         output_path = os.path.join(self.volume_path, file_to_create)
-        df.to_csv(output_path, index=False)
-        print(f"Created CSV file at '{output_path}'.")
+        partial_path = os.path.join(self.volume_path, '.' + file_to_create + _PARTIAL_SUFFIX)
+
+        rows = iter(rows)
+        n_rows = 0
+        with open(partial_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            ## Write in batches of 10,000 rows
+            for batch in iter(lambda: list(itertools.islice(rows, 10000)), []):
+                writer.writerows(batch)
+                n_rows = n_rows + len(batch)
+        os.replace(partial_path, output_path)
+        if self._volume_files is not None:
+            self._volume_files.add(file_to_create)
+        return n_rows
+
+    def create_csv_file(self, csv_string: str, file_to_create: str):
+        ## 'null' values are written as empty fields, which read_files reads as NULL
+        reader = csv.reader(StringIO(csv_string))
+        header = next(reader)
+        rows = ([None if value == 'null' else value for value in row] for row in reader)
+        n_rows = self.write_csv_rows(file_to_create, header, rows)
+        print(f"Created CSV file at '{os.path.join(self.volume_path, file_to_create)}' with {n_rows} rows.")
 
     def create_csv_file_if_not_exists(self, file_name: str, csv_data_func: callable):
         if not self.check_if_file_exists(file_name=file_name):
@@ -345,12 +495,124 @@ null,test,test,test,9999,2025-01-01,new,2025-06-05
 6,,,,,,delete,2025-07-22
 2,,,,,,delete,2025-07-22"""
 
-    def copy_file(self, copy_file: str, to_target_volume: str):
-        dbutils.fs.cp(f'{self.volume_path}/{copy_file}', f'{to_target_volume}/{copy_file}')
-        print(f"Moving file '{self.volume_path}/{copy_file}' to '{to_target_volume}/{copy_file}'.")
+    def generate_employee_rows(self,
+                               n_rows: int,
+                               operation_mix: dict = {'new': 0.8, 'update': 0.15, 'delete': 0.05},
+                               null_id_rate: float = 0.0,
+                               invalid_country_rate: float = 0.0,
+                               process_date: str = '2025-06-05',
+                               seed: int = None,
+                               employees: dict = None):
+        """
+        Yields synthetic employee rows in the lab CSV layout (EmployeeID, FirstName, Country, Department, Salary, HireDate, Operation, ProcessDate).
+
+        Rows are generated one at a time, so millions of rows can be streamed to files with write_csv_rows.
+        Updates and deletes only target employees created earlier in the dataset, and deletes leave every column except EmployeeID,
+        Operation and ProcessDate empty, the same as the lab files.
+
+        Parameters:
+        - n_rows (int): Number of rows to generate.
+        - operation_mix (dict, optional): Relative weights of the 'new', 'update' and 'delete' operations. Default is 80% new, 15% update, 5% delete.
+        - null_id_rate (float, optional): Fraction of rows with an empty EmployeeID, dropped by the check_null_id expectation. Default is 0.0.
+        - invalid_country_rate (float, optional): Fraction of rows with a country other than US or GR, flagged by the check_country expectation. Default is 0.0.
+        - process_date (str, optional): The ProcessDate of every row. Default is '2025-06-05'.
+        - seed (int, optional): Random seed for a reproducible dataset. Default is None.
+        - employees (dict, optional): The next EmployeeID ('next_id') and the ids that can be updated or deleted ('live_ids').
+                                      It is updated in place, so consecutive calls continue the same dataset. Default is None, which starts at id 1.
+        """
+        rng = random.Random(seed)
+        employees = employees if employees is not None else {}
+        live_ids = employees.setdefault('live_ids', [])
+        employees.setdefault('next_id', 1)
+        operations = list(operation_mix.keys())
+        weights = list(operation_mix.values())
+        first_names = ['Sophia', 'Nikos', 'Liam', 'Elena', 'James', 'Emily', 'Yannis', 'Panagiotis', 'Maria', 'Noah']
+        departments = ['Sales', 'IT', 'Enablement', 'HR']
+        invalid_countries = ['FR', 'DE', 'IT', 'ES', 'XX']
+
+        for _ in range(n_rows):
+            operation = rng.choices(operations, weights)[0] if live_ids else 'new'
+
+            ## Rows with a null id do not create, update or delete an employee
+            if rng.random() < null_id_rate:
+                employee_id = None
+            elif operation == 'new':
+                employee_id = employees['next_id']
+                employees['next_id'] = employee_id + 1
+                live_ids.append(employee_id)
+            else:
+                index = rng.randrange(len(live_ids))
+                employee_id = live_ids[index]
+                if operation == 'delete':
+                    live_ids[index] = live_ids[-1]
+                    live_ids.pop()
+
+            if operation == 'delete':
+                yield [employee_id, None, None, None, None, None, operation, process_date]
+                continue
+
+            country = rng.choice(invalid_countries) if rng.random() < invalid_country_rate else rng.choice(['US', 'GR'])
+            yield [employee_id,
+                   rng.choice(first_names),
+                   country if rng.random() < 0.7 else country.lower(),
+                   rng.choice(departments),
+                   rng.randrange(40000, 150000, 1000),
+                   f'2025-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}',
+                   operation,
+                   process_date]
+
+    def create_synthetic_employee_files(self,
+                                        n_rows: int,
+                                        n_files: int = 1,
+                                        file_prefix: str = 'synthetic_employees',
+                                        operation_mix: dict = {'new': 0.8, 'update': 0.15, 'delete': 0.05},
+                                        null_id_rate: float = 0.0,
+                                        invalid_country_rate: float = 0.0,
+                                        seed: int = None) -> list:
+        """
+        Streams a synthetic employee dataset of n_rows rows across n_files CSV files in the staging volume, to load test the
+        employees_*_lab4_solution pipeline. Copy the files to the lab_files volume with copy_file to ingest them.
+
+        The files are named <file_prefix>_<n>.csv and each file gets the next ProcessDate, so the files replay as consecutive daily batches.
+        Updates and deletes in later files target employees created in earlier files.
+
+        Returns:
+        - list: The names of the files created.
+
+        Example:
+          LabSetup.create_synthetic_employee_files(n_rows=5_000_000, n_files=50, null_id_rate=0.01, invalid_country_rate=0.02, seed=42)
+        """
+        import datetime
+
+        if n_files < 1 or n_rows < n_files:
+            raise ValueError(f"n_files must be between 1 and n_rows ({n_rows}), got {n_files}.")
+
+        rng = random.Random(seed)
+        employees = {'next_id': 1, 'live_ids': []}
+        files_created = []
+        for n in range(n_files):
+            file_name = f'{file_prefix}_{n + 1}.csv'
+            rows_in_file = n_rows // n_files + (1 if n < n_rows % n_files else 0)
+            process_date = (datetime.date(2025, 6, 5) + datetime.timedelta(days=n)).isoformat()
+            rows = self.generate_employee_rows(rows_in_file, operation_mix, null_id_rate, invalid_country_rate,
+                                               process_date=process_date, seed=rng.random(), employees=employees)
+
+            self.write_csv_rows(file_name, ['EmployeeID', 'FirstName', 'Country', 'Department', 'Salary', 'HireDate', 'Operation', 'ProcessDate'], rows)
+            files_created.append(file_name)
+            print(f"Created '{os.path.join(self.volume_path, file_name)}' with {rows_in_file} rows.")
+
+        return files_created
+
+    def copy_file(self, copy_file: str, to_target_volume: str, zero_copy: bool = False, compression: str = None):
+        target_file = copy_file + _COMPRESSION_EXTENSIONS.get(compression, '')
+        result = _copy_single_file(f'{self.volume_path}/{copy_file}', f'{to_target_volume}/{target_file}', zero_copy=zero_copy, compression=compression)
+        print(f"Moving file '{self.volume_path}/{copy_file}' to '{to_target_volume}/{target_file}' ({result['method']}).")
 
     def delete_lab_staging_files(self):
         dbutils.fs.rm(self.volume_path, True)
+        self._volume_files = set()
+        if self.file_index is not None:
+            self.file_index.forget(self.volume_path)
         print(f"Deleted all files in '{self.volume_path}'.")
 
     def __str__(self):
@@ -358,6 +620,10 @@ null,test,test,test,9999,2025-01-01,new,2025-06-05
 
 # COMMAND ----------
 
+## Time the lab setup helpers when instrument_setup = True is set
+if globals().get('instrument_setup', False):
+    setup_instrumentation.enable()
+
 ## Create volume for the lab
 create_volume(in_catalog=DA.catalog_name, in_schema = 'default', volume_name = 'lab_staging_files')
 create_volume(in_catalog=DA.catalog_name, in_schema = 'default', volume_name = 'lab_files')
@@ -366,11 +632,8 @@ create_volume(in_catalog=DA.catalog_name, in_schema = 'default', volume_name = '
 create_schemas(in_catalog = DA.catalog_name, schema_names = ['lab_1_bronze_db', 'lab_2_silver_db', 'lab_3_gold_db'])
 
 
-## Create the country_lookup table if it doesn't exist
-if spark.catalog.tableExists(f"{DA.catalog_name}.default.country_lookup") == False:
-    create_country_lookup_table(in_catalog = DA.catalog_name, in_schema = 'default')
-else:
-    print(f'Table {DA.catalog_name}.default.country_lookup already exists. No action taken')
+## Create the country_lookup table if it doesn't exist or its reference data changed
+create_country_lookup_table(in_catalog = DA.catalog_name, in_schema = 'default')
 
 delete_source_files(f'/Volumes/{DA.catalog_name}/default/lab_files/')
 delete_source_files(f'/Volumes/{DA.catalog_name}/default/lab_files_staging/')
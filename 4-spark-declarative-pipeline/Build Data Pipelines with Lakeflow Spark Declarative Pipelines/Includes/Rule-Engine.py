@@ -0,0 +1,125 @@
+# Databricks notebook source
+##
+## DATA QUALITY RULE-SET ENGINE
+##
+## Compiles a declarative rule set (Includes/rules/<table>.json) into one projection of boolean flag columns and one filter, so a table
+## with dozens of rules is checked in a single pass with a single expression tree instead of one expectation per rule.
+##
+## Rule set format:
+##   {
+##     "table": "orders_silver_demo3",
+##     "rules": [
+##       {"name": "valid_date", "predicate": "order_timestamp > '2021-12-26'", "action": "drop", "severity": "high"},
+##       ...
+##     ]
+##   }
+##
+## - predicate: A SQL boolean expression that is TRUE for valid rows. A NULL result counts as a failure.
+## - action:    'warn' keeps the row, 'drop' removes it, 'fail' stops the update.
+## - severity:  'low', 'medium' or 'high'. The dq_severity column holds the highest severity of the rules a kept row failed.
+##
+## The compiled rule set is passed to the pipelines as configuration keys (see rule_set_configuration), so the same rule file drives
+## the SQL and the Python pipelines.
+##
+
+RULE_ACTIONS = ['warn', 'drop', 'fail']
+RULE_SEVERITIES = ['low', 'medium', 'high']
+
+# COMMAND ----------
+
+def load_rule_set(rule_set_path: str) -> dict:
+    '''
+    Loads and validates a rule set file.
+
+    Parameters:
+    - rule_set_path (str): Path to the rule set JSON file.
+
+    Returns:
+    - dict: The rule set with the 'table' name and its 'rules'.
+
+    Example:
+    - load_rule_set('./Includes/rules/orders_silver_demo3.json')
+    '''
+    import re
+    import json
+
+    with open(rule_set_path) as f:
+        rule_set = json.load(f)
+
+    names = set()
+    for rule in rule_set['rules']:
+        if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', rule['name']):
+            raise ValueError(f"Rule name '{rule['name']}' in {rule_set_path} must only contain letters, digits and underscores.")
+        if rule['name'] in names:
+            raise ValueError(f"Rule name '{rule['name']}' is defined more than once in {rule_set_path}.")
+        if rule.get('action', 'warn') not in RULE_ACTIONS:
+            raise ValueError(f"Rule '{rule['name']}' in {rule_set_path} has action '{rule['action']}'. Use one of {RULE_ACTIONS}.")
+        if rule.get('severity', 'medium') not in RULE_SEVERITIES:
+            raise ValueError(f"Rule '{rule['name']}' in {rule_set_path} has severity '{rule['severity']}'. Use one of {RULE_SEVERITIES}.")
+        names.add(rule['name'])
+
+    return rule_set
+
+
+def compile_rule_set(rule_set: dict) -> dict:
+    '''
+    Compiles a rule set into SQL expressions:
+
+    - flags:    Flag column name (dq_<rule name>) -> expression that is TRUE when the row fails the rule.
+    - severity: Expression over the flag columns with the highest severity of the failed rules, or NULL.
+    - filter:   One boolean expression over the flag columns. It raises an error if any 'fail' rule failed, otherwise it keeps the rows
+                that passed every 'drop' rule.
+
+    The flags are computed once per row in one projection. The severity and the filter only read the flag columns.
+    '''
+    flags = {}
+    for rule in rule_set['rules']:
+        flags[f"dq_{rule['name']}"] = f"NOT coalesce(({rule['predicate']}), false)"
+
+    ## Highest severity of the failed rules, checked from high to low
+    severity_cases = []
+    for severity in reversed(RULE_SEVERITIES):
+        failed = [f"dq_{rule['name']}" for rule in rule_set['rules'] if rule.get('severity', 'medium') == severity]
+        if failed:
+            severity_cases.append(f"WHEN {' OR '.join(failed)} THEN '{severity}'")
+    severity = f"CASE {' '.join(severity_cases)} END" if severity_cases else 'CAST(NULL AS STRING)'
+
+    drop_flags = [f"dq_{rule['name']}" for rule in rule_set['rules'] if rule.get('action', 'warn') == 'drop']
+    fail_rules = [rule for rule in rule_set['rules'] if rule.get('action', 'warn') == 'fail']
+
+    keep = f"NOT ({' OR '.join(drop_flags)})" if drop_flags else 'true'
+    if fail_rules:
+        fail_cases = ' '.join(f"WHEN dq_{rule['name']} THEN raise_error('Data quality rule {rule['name']} ({rule.get('severity', 'medium')}) failed on {rule_set['table']}')"
+                              for rule in fail_rules)
+        row_filter = f"CASE {fail_cases} ELSE {keep} END"
+    else:
+        row_filter = keep
+
+    return {'flags': flags, 'severity': severity, 'filter': row_filter}
+
+
+def rule_set_configuration(rule_set_paths: list) -> dict:
+    '''
+    Returns pipeline configuration keys with the compiled rule sets, to pass in the configuration of create_declarative_pipeline.
+
+    For each rule set the keys are:
+    - rules.<table>:          The compiled rule set as JSON, read by the Python pipelines.
+    - rules.<table>.flags:    The flag columns as a SQL select list, used as ${rules.<table>.flags} in the SQL pipelines.
+    - rules.<table>.severity: The severity expression, used as ${rules.<table>.severity} in the SQL pipelines.
+    - rules.<table>.filter:   The filter expression, used as ${rules.<table>.filter} in the SQL pipelines.
+
+    Example:
+    - create_declarative_pipeline(..., rule_sets=['./Includes/rules/orders_silver_demo3.json'])
+    '''
+    import json
+
+    configuration = {}
+    for rule_set_path in rule_set_paths:
+        rule_set = load_rule_set(rule_set_path)
+        compiled = compile_rule_set(rule_set)
+        table = rule_set['table']
+        configuration[f'rules.{table}'] = json.dumps(compiled)
+        configuration[f'rules.{table}.flags'] = ', '.join(f'{expression} AS {name}' for name, expression in compiled['flags'].items())
+        configuration[f'rules.{table}.severity'] = compiled['severity']
+        configuration[f'rules.{table}.filter'] = compiled['filter']
+    return configuration
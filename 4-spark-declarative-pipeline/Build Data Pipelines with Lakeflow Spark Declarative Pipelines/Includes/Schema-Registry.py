@@ -0,0 +1,66 @@
+# Databricks notebook source
+##
+## SCHEMA REGISTRY FOR THE BRONZE READERS
+##
+## Versioned DDL schemas of the raw course sources, so the bronze Auto Loader / read_files readers can use an explicit schema
+## instead of sampling files to infer one on every fresh checkpoint or schema location.
+##
+## Add a new version instead of editing an existing one, so pipelines pinned to a version keep reading the same columns and types.
+##
+## The Python pipelines (python_excluded) read 'schema.orders' with spark.conf.get. SQL cannot reference an optional configuration key,
+## so the SQL pipelines that use the registry are opt-in variants in the schema_excluded folders that read '${schema.<source>}'.
+##
+
+SCHEMA_REGISTRY = {
+    'orders': {
+        1: 'order_id BIGINT, order_timestamp STRING, customer_id BIGINT, notifications STRING'
+    },
+    'employees': {
+        1: 'EmployeeID INT, FirstName STRING, Country STRING, Department STRING, Salary INT, HireDate DATE, Operation STRING, ProcessDate DATE'
+    }
+}
+
+# COMMAND ----------
+
+def get_source_schema(source: str, version: int = None) -> str:
+    '''
+    Returns the DDL schema of a source from the schema registry.
+
+    Parameters:
+    - source (str): The source name ('orders' or 'employees').
+    - version (int, optional): The schema version. Default is None, which returns the latest version.
+
+    Returns:
+    - str: The DDL schema, for example 'order_id BIGINT, order_timestamp STRING, ...'. It can be passed to DataStreamReader.schema
+           or the schema option of read_files.
+
+    Example:
+    - get_source_schema('orders')
+    '''
+    if source not in SCHEMA_REGISTRY:
+        raise ValueError(f"Source '{source}' is not in the schema registry. Available sources: {sorted(SCHEMA_REGISTRY)}")
+
+    versions = SCHEMA_REGISTRY[source]
+    version = max(versions) if version is None else version
+    if version not in versions:
+        raise ValueError(f"Schema version {version} does not exist for source '{source}'. Available versions: {sorted(versions)}")
+    return versions[version]
+
+
+def schema_registry_configuration(sources: list = None, version: int = None) -> dict:
+    '''
+    Returns pipeline configuration keys with the registry schema of each source, to pass in the configuration of create_declarative_pipeline.
+
+    The pipelines read 'schema.<source>' and use it as the explicit schema of the bronze reader. If it is not set they infer the schema.
+
+    Parameters:
+    - sources (list, optional): The source names. Default is None, which returns every source.
+    - version (int, optional): The schema version. Default is None, which uses the latest version of each source.
+
+    Example:
+    - create_declarative_pipeline(..., configuration={'source': DA.paths.working_dir, **schema_registry_configuration(['orders'])})
+    '''
+    configuration = {}
+    for source in sources or sorted(SCHEMA_REGISTRY):
+        configuration[f'schema.{source}'] = get_source_schema(source, version)
+    return configuration
@@ -0,0 +1,142 @@
+##
+## COMPRESSED VERSUS UNCOMPRESSED LANDING BENCHMARK
+##
+## Stages the same synthetic JSON or CSV files into a landing folder with copy_files using no compression, gzip and zstd
+## (when the zstandard package is installed), and reports the bytes moved and the staging time for each.
+##
+## If pyspark is installed, the landing folder is also read into a bronze DataFrame with spark.read so the end-to-end
+## ingest time includes decompression. Auto Loader (cloudFiles) is only available on Databricks, so on a workspace run
+## the same comparison by pointing the bronze streaming table at each landing folder.
+##
+## Usage:
+##   python benchmark_compressed_landing.py                                 # 1k JSON files
+##   python benchmark_compressed_landing.py --files 5000 --format csv --output results.json
+##
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from local_standins import load_setup_notebook
+
+INCLUDES_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMON_NOTEBOOK_PATH = os.path.join(INCLUDES_PATH, 'Classroom-Setup-Common.py')
+
+
+def create_order_files(path: str, n_files: int, rows_per_file: int, file_format: str):
+    '''
+    Creates n_files synthetic order files in JSON lines or CSV format, similar to the course orders data.
+    '''
+    os.makedirs(path, exist_ok = True)
+    rng = random.Random(42)
+    for i in range(n_files):
+        rows = [{'order_id': i * rows_per_file + j,
+                 'order_timestamp': 1704067200 + rng.randint(0, 86400 * 30),
+                 'customer_id': rng.randint(1, 5000),
+                 'notifications': rng.choice(['Y', 'N'])} for j in range(rows_per_file)]
+        with open(os.path.join(path, f'{i:05}.{file_format}'), 'w') as f:
+            if file_format == 'csv':
+                f.write('order_id,order_timestamp,customer_id,notifications\n')
+                f.writelines(f"{r['order_id']},{r['order_timestamp']},{r['customer_id']},{r['notifications']}\n" for r in rows)
+            else:
+                f.writelines(json.dumps(r) + '\n' for r in rows)
+
+
+def available_compressions() -> list:
+    '''
+    Returns the compressions to benchmark. zstd is only included when the zstandard package is installed.
+    '''
+    compressions = [None, 'gzip']
+    try:
+        import zstandard
+        compressions.append('zstd')
+    except ImportError:
+        print('zstandard is not installed. Skipping zstd.')
+    return compressions
+
+
+def get_spark():
+    '''
+    Returns a local SparkSession, or None if pyspark is not installed.
+    '''
+    try:
+        from pyspark.sql import SparkSession
+    except ImportError:
+        print('pyspark is not installed. Skipping the bronze ingest timing.')
+        return None
+    return SparkSession.builder.master('local[*]').appName('compressed_landing_benchmark').getOrCreate()
+
+
+def ingest_bronze(spark, landing_path: str, file_format: str, compression: str) -> tuple:
+    '''
+    Reads every file in the landing folder into a bronze DataFrame and returns the row count and the elapsed seconds.
+    Spark decompresses .gz files natively. .zst files require Hadoop native zstd support.
+    '''
+    glob = f'*.{file_format}' + {'gzip': '.gz', 'zstd': '.zst'}.get(compression, '')
+    start_time = time.perf_counter()
+    reader = spark.read.option('pathGlobFilter', glob)
+    if file_format == 'csv':
+        reader = reader.option('header', True)
+    n_rows = reader.format(file_format).load(landing_path).count()
+    return n_rows, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Compare bytes moved and ingest time for compressed and uncompressed landings.')
+    parser.add_argument('--files', type = int, default = 1000, help = 'Number of landing files.')
+    parser.add_argument('--rows-per-file', type = int, default = 500, help = 'Rows per landing file.')
+    parser.add_argument('--format', choices = ['json', 'csv'], default = 'json', help = 'Landing file format.')
+    parser.add_argument('--max-workers', type = int, default = 8, help = 'Thread pool size passed to copy_files.')
+    parser.add_argument('--work-dir', default = None, help = 'Folder for the synthetic files. Default is a temporary folder.')
+    parser.add_argument('--output', default = None, help = 'Write the results as JSON to this path.')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix = 'compressed_landing_', dir = args.work_dir)
+    try:
+        helpers = load_setup_notebook(COMMON_NOTEBOOK_PATH, working_dir = work_dir)
+        source_path = os.path.join(work_dir, 'source')
+        create_order_files(source_path, args.files, args.rows_per_file, args.format)
+        spark = get_spark()
+        compressions = available_compressions()
+
+        print(f"{'Compression':<14}{'Bytes moved':>14}{'Ratio':>8}{'Stage sec':>11}{'Ingest sec':>12}{'Total sec':>11}")
+        results = []
+        for compression in compressions:
+            landing_path = os.path.join(work_dir, f'landing_{compression or "none"}')
+            os.makedirs(landing_path)
+            with contextlib.redirect_stdout(io.StringIO()):
+                copy_result = helpers['copy_files'](source_path, landing_path, args.files, mode = 'fast',
+                                                    max_workers = args.max_workers, zero_copy = False, compression = compression)
+
+            n_rows, ingest_seconds = ingest_bronze(spark, landing_path, args.format, compression) if spark else (None, None)
+            result = {'compression': compression or 'none',
+                      'bytes_read': copy_result['bytes'],
+                      'bytes_moved': copy_result['bytes_written'],
+                      'stage_seconds': copy_result['seconds'],
+                      'ingest_seconds': ingest_seconds,
+                      'rows': n_rows}
+            results.append(result)
+
+            ingest = f'{ingest_seconds:>12.3f}' if ingest_seconds is not None else f"{'-':>12}"
+            total = f"{copy_result['seconds'] + ingest_seconds:>11.3f}" if ingest_seconds is not None else f"{'-':>11}"
+            print(f"{result['compression']:<14}{result['bytes_moved']:>14}{result['bytes_moved'] / max(result['bytes_read'], 1):>8.1%}"
+                  f"{result['stage_seconds']:>11.3f}{ingest}{total}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors = True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'results': results}, f, indent = 2)
+        print(f'\nResults written to {args.output}.')
+
+
+if __name__ == '__main__':
+    main()
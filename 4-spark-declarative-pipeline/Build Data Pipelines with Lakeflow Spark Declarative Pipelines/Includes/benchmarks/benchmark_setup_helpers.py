@@ -0,0 +1,151 @@
+##
+## BENCHMARK SUITE FOR THE CLASSROOM SETUP HELPERS
+##
+## Runs copy_files, delete_source_files, create_directory_in_user_volume and drop_tables from Classroom-Setup-Common
+## against synthetic trees using the local stand-ins, and reports operations per second.
+##
+## Usage:
+##   python benchmark_setup_helpers.py                                  # 1k, 10k and 100k files
+##   python benchmark_setup_helpers.py --sizes 1000 10000 --output results.json
+##   python benchmark_setup_helpers.py --baseline results.json --tolerance 0.25   # exits with 1 on a regression
+##
+
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from local_standins import LocalCatalogSpark, load_setup_notebook
+
+INCLUDES_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMON_NOTEBOOK_PATH = os.path.join(INCLUDES_PATH, 'Classroom-Setup-Common.py')
+
+
+def create_synthetic_tree(path: str, n_files: int, file_size: int = 512):
+    '''
+    Creates n_files JSON files of file_size bytes in path.
+    '''
+    os.makedirs(path, exist_ok = True)
+    payload = ('{"value": "' + 'x' * max(file_size - 14, 0) + '"}\n').encode('utf-8')
+    for i in range(n_files):
+        with open(os.path.join(path, f'{i:07}.json'), 'wb') as f:
+            f.write(payload)
+
+
+def run_benchmark(name: str, n_ops: int, func: callable) -> dict:
+    '''
+    Runs func with the helper output silenced and returns its ops/sec.
+    '''
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+    elapsed = time.perf_counter() - start_time
+    result = {'benchmark': name, 'ops': n_ops, 'seconds': elapsed, 'ops_per_sec': n_ops / max(elapsed, 1e-9)}
+    print(f"{name:<50}{n_ops:>9}{elapsed:>11.3f}{result['ops_per_sec']:>14.1f}")
+    return result
+
+
+def benchmark_size(n_files: int, work_dir: str, max_workers: int) -> list:
+    '''
+    Runs every benchmark for one tree size.
+    '''
+    spark = LocalCatalogSpark({'dbacademy': {'default': {}, '1_bronze_db': {}, '2_silver_db': {}, '3_gold_db': {}}})
+    helpers = load_setup_notebook(COMMON_NOTEBOOK_PATH, spark = spark, working_dir = work_dir)
+
+    source_path = os.path.join(work_dir, 'source')
+    target_path = os.path.join(work_dir, 'target')
+    create_synthetic_tree(source_path, n_files)
+    os.makedirs(target_path, exist_ok = True)
+
+    results = []
+
+    ## Copy: byte copy and zero-copy (reflink/hardlink when supported)
+    results.append(run_benchmark(f'copy_files[fast, copy] n={n_files}', n_files,
+                                 lambda: helpers['copy_files'](source_path, target_path, n_files, mode = 'fast', max_workers = max_workers, zero_copy = False)))
+    results.append(run_benchmark(f'copy_files[rerun, name skip] n={n_files}', n_files,
+                                 lambda: helpers['copy_files'](source_path, target_path, n_files, mode = 'fast', max_workers = max_workers)))
+
+    ## Delete
+    results.append(run_benchmark(f'delete_source_files[parallel] n={n_files}', n_files,
+                                 lambda: helpers['delete_source_files'](target_path, mode = 'parallel', max_workers = max_workers)))
+
+    results.append(run_benchmark(f'copy_files[fast, zero_copy] n={n_files}', n_files,
+                                 lambda: helpers['copy_files'](source_path, target_path, n_files, mode = 'fast', max_workers = max_workers, zero_copy = True)))
+    results.append(run_benchmark(f'delete_source_files[bulk] n={n_files}', n_files,
+                                 lambda: helpers['delete_source_files'](target_path, mode = 'bulk')))
+
+    ## Directories: n_files folders laid out as tenant_<i>/<source>
+    landing_path = os.path.join(work_dir, 'landing')
+    os.makedirs(landing_path, exist_ok = True)
+    folders = [f'tenant_{i // 3}/{["customers", "orders", "status"][i % 3]}' for i in range(n_files)]
+    results.append(run_benchmark(f'create_directory_in_user_volume n={n_files}', n_files,
+                                 lambda: helpers['create_directory_in_user_volume'](landing_path, folders, max_workers = max_workers, verbose = False)))
+    results.append(run_benchmark(f'create_directory_in_user_volume[existing] n={n_files}', n_files,
+                                 lambda: helpers['create_directory_in_user_volume'](landing_path, folders, max_workers = max_workers, verbose = False)))
+
+    ## Drop tables: n_files tables and views across the three course schemas
+    schemas = ['1_bronze_db', '2_silver_db', '3_gold_db']
+    for i in range(n_files):
+        spark.add_table('dbacademy', schemas[i % 3], f'table_{i:07}', ['MANAGED', 'VIEW', 'MATERIALIZED_VIEW', 'STREAMING_TABLE'][i % 4])
+    results.append(run_benchmark(f'drop_tables n={n_files}', n_files,
+                                 lambda: helpers['drop_tables']('dbacademy', schemas, max_workers = max_workers)))
+
+    return results
+
+
+def compare_with_baseline(results: list, baseline_path: str, tolerance: float) -> list:
+    '''
+    Returns the benchmarks whose ops/sec dropped by more than the tolerance compared to the baseline results.
+    '''
+    with open(baseline_path) as f:
+        baseline = {result['benchmark']: result for result in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['benchmark'])
+        if previous and result['ops_per_sec'] < previous['ops_per_sec'] * (1 - tolerance):
+            regressions.append({'benchmark': result['benchmark'], 'baseline_ops_per_sec': previous['ops_per_sec'], 'ops_per_sec': result['ops_per_sec']})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark the Classroom-Setup-Common helpers against synthetic trees.')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [1000, 10000, 100000], help = 'Number of files per synthetic tree.')
+    parser.add_argument('--max-workers', type = int, default = 16, help = 'Thread pool size passed to the helpers.')
+    parser.add_argument('--work-dir', default = None, help = 'Folder for the synthetic trees. Default is a temporary folder.')
+    parser.add_argument('--output', default = None, help = 'Write the results as JSON to this path.')
+    parser.add_argument('--baseline', default = None, help = 'JSON results of a previous run to compare against.')
+    parser.add_argument('--tolerance', type = float, default = 0.25, help = 'Allowed ops/sec drop versus the baseline. Default is 0.25 (25%%).')
+    args = parser.parse_args()
+
+    print(f"{'Benchmark':<50}{'Ops':>9}{'Seconds':>11}{'Ops/sec':>14}")
+    results = []
+    for n_files in args.sizes:
+        work_dir = tempfile.mkdtemp(prefix = f'setup_benchmark_{n_files}_', dir = args.work_dir)
+        try:
+            results.extend(benchmark_size(n_files, work_dir, args.max_workers))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors = True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'results': results}, f, indent = 2)
+        print(f'\nResults written to {args.output}.')
+
+    if args.baseline:
+        regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression['benchmark']}: {regression['ops_per_sec']:.1f} ops/sec (baseline {regression['baseline_ops_per_sec']:.1f})")
+        if regressions:
+            sys.exit(1)
+        print(f'\nNo regressions larger than {args.tolerance:.0%} compared to {args.baseline}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+##
+## LOCAL STAND-INS FOR dbutils AND spark
+##
+## Lets the helpers in Classroom-Setup-Common run outside of a Databricks workspace, backed by the local filesystem
+## and an in-memory catalog. Used by benchmark_setup_helpers.py.
+##
+
+import os
+import re
+import sys
+import shutil
+import types
+from collections import namedtuple
+
+
+FileInfo = namedtuple('FileInfo', ['path', 'name', 'size', 'modificationTime'])
+
+
+def _local_path(path: str) -> str:
+    '''
+    Removes the dbfs: and file: schemes so the path can be used with the local filesystem.
+    '''
+    return re.sub(r'^(dbfs|file):', '', path)
+
+
+class LocalFs:
+    """
+    Stand-in for dbutils.fs backed by the local filesystem (cp, mv, rm, ls, mkdirs, head and put).
+    """
+
+    def cp(self, from_path: str, to_path: str, recurse: bool = False) -> bool:
+        from_path, to_path = _local_path(from_path), _local_path(to_path)
+        os.makedirs(os.path.dirname(to_path) or '.', exist_ok = True)
+        if os.path.isdir(from_path):
+            if not recurse:
+                raise IsADirectoryError(f'{from_path} is a directory. Use recurse=True to copy it.')
+            shutil.copytree(from_path, to_path, dirs_exist_ok = True)
+        else:
+            shutil.copyfile(from_path, to_path)
+        return True
+
+    def mv(self, from_path: str, to_path: str, recurse: bool = False) -> bool:
+        from_path, to_path = _local_path(from_path), _local_path(to_path)
+        os.makedirs(os.path.dirname(to_path) or '.', exist_ok = True)
+        shutil.move(from_path, to_path)
+        return True
+
+    def rm(self, path: str, recurse: bool = False) -> bool:
+        path = _local_path(path)
+        if os.path.isdir(path):
+            if recurse:
+                shutil.rmtree(path)
+            else:
+                os.rmdir(path)
+        elif os.path.exists(path):
+            os.remove(path)
+        else:
+            return False
+        return True
+
+    def ls(self, path: str) -> list:
+        path = _local_path(path)
+        files = []
+        with os.scandir(path) as entries:
+            for entry in sorted(entries, key = lambda entry: entry.name):
+                entry_stat = entry.stat()
+                is_dir = entry.is_dir()
+                files.append(FileInfo(path = entry.path + ('/' if is_dir else ''),
+                                      name = entry.name + ('/' if is_dir else ''),
+                                      size = 0 if is_dir else entry_stat.st_size,
+                                      modificationTime = int(entry_stat.st_mtime * 1000)))
+        return files
+
+    def mkdirs(self, path: str) -> bool:
+        os.makedirs(_local_path(path), exist_ok = True)
+        return True
+
+    def head(self, path: str, max_bytes: int = 65536) -> str:
+        with open(_local_path(path), 'rb') as f:
+            return f.read(max_bytes).decode('utf-8', errors = 'replace')
+
+    def put(self, path: str, contents: str, overwrite: bool = False) -> bool:
+        path = _local_path(path)
+        if os.path.exists(path) and not overwrite:
+            raise FileExistsError(f'{path} already exists. Use overwrite=True to replace it.')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+        with open(path, 'w') as f:
+            f.write(contents)
+        return True
+
+
+class LocalDbutils:
+    """
+    Stand-in for dbutils with a local filesystem backed dbutils.fs.
+    """
+
+    def __init__(self):
+        self.fs = LocalFs()
+
+
+class _Result:
+    def __init__(self, rows: list):
+        self._rows = rows
+
+    def collect(self) -> list:
+        return list(self._rows)
+
+
+class LocalCatalogSpark:
+    """
+    Stand-in for the spark session that answers the catalog statements issued by the setup helpers from an in-memory catalog.
+
+    Supported statements: SHOW CATALOGS, SHOW SCHEMAS IN, CREATE SCHEMA/VOLUME IF NOT EXISTS, the information_schema.tables and
+    information_schema.volumes queries, the system.information_schema volume path query, DROP TABLE/VIEW/MATERIALIZED VIEW IF EXISTS,
+    and the dbacademy.ops.meta query with the DA variable statements. Every statement is recorded in `queries`.
+
+    Example:
+      spark = LocalCatalogSpark({'dbacademy': {'default': {}}})
+      spark.add_table('dbacademy', 'default', 'orders', 'MANAGED')
+    """
+
+    def __init__(self, catalogs: dict = None, meta: dict = None):
+        ## catalog -> schema -> table name -> table type
+        self.catalogs = catalogs if catalogs is not None else {}
+        ## dbacademy.ops.meta key -> value, and SQL session variables
+        self.meta = meta if meta is not None else {'username': 'labuser@example.com', 'catalog.name': 'dbacademy'}
+        self.variables = {}
+        ## catalog -> schema -> set of volume names
+        self.volumes = {}
+        self.queries = []
+
+    def add_table(self, catalog: str, schema: str, table: str, table_type: str = 'MANAGED'):
+        self.catalogs.setdefault(catalog, {}).setdefault(schema, {})[table] = table_type
+
+    def sql(self, query: str, args: dict = None) -> _Result:
+        self.queries.append(query)
+        statement = ' '.join(query.split())
+        Row = types.SimpleNamespace
+
+        if statement == "SELECT replace(key, '.', '_') AS key, value FROM dbacademy.ops.meta":
+            return _Result([Row(key = key.replace('.', '_'), value = value) for key, value in self.meta.items()])
+
+        match = re.fullmatch(r'DECLARE OR REPLACE VARIABLE (\S+) .*', statement)
+        if match:
+            self.variables[match.group(1)] = None
+            return _Result([])
+
+        match = re.fullmatch(r'SET VAR (\S+) = map_from_arrays\(:keys, :values\)', statement)
+        if match:
+            self.variables[match.group(1)] = dict(zip(args['keys'], args['values']))
+            return _Result([])
+
+        if statement == 'SHOW CATALOGS':
+            return _Result([Row(catalog = catalog) for catalog in self.catalogs])
+
+        match = re.fullmatch(r'SHOW SCHEMAS IN (\S+)', statement)
+        if match:
+            return _Result([Row(databaseName = schema) for schema in self.catalogs[match.group(1)]])
+
+        match = re.fullmatch(r'CREATE SCHEMA IF NOT EXISTS (\S+)\.(\S+)', statement)
+        if match:
+            self.catalogs[match.group(1)].setdefault(match.group(2), {})
+            return _Result([])
+
+        match = re.fullmatch(r'CREATE VOLUME IF NOT EXISTS (\S+)\.(\S+)\.(\S+)', statement)
+        if match:
+            self.volumes.setdefault(match.group(1), {}).setdefault(match.group(2), set()).add(match.group(3))
+            return _Result([])
+
+        match = re.fullmatch(r'SELECT table_schema, table_name, table_type FROM (\S+)\.information_schema\.tables', statement)
+        if match:
+            return _Result([Row(table_schema = schema, table_name = table, table_type = table_type)
+                            for schema, tables in self.catalogs[match.group(1)].items()
+                            for table, table_type in tables.items()])
+
+        match = re.fullmatch(r'SELECT volume_schema, volume_name FROM (\S+)\.information_schema\.volumes', statement)
+        if match:
+            return _Result([Row(volume_schema = schema, volume_name = volume)
+                            for schema, volumes in self.volumes.get(match.group(1), {}).items()
+                            for volume in volumes])
+
+        if 'system.information_schema.volumes' in statement:
+            catalog, schema, volume = args['catalog'], args['schema'], args['volume']
+            return _Result([Row(catalog_exists = catalog in self.catalogs,
+                                schema_exists = schema in self.catalogs.get(catalog, {}),
+                                volume_exists = volume in self.volumes.get(catalog, {}).get(schema, set()))])
+
+        match = re.fullmatch(r'DROP (TABLE|VIEW|MATERIALIZED VIEW) IF EXISTS (\S+)\.(\S+)\.(\S+)', statement)
+        if match:
+            kind, catalog, schema, table = match.groups()
+            table_type = self.catalogs.get(catalog, {}).get(schema, {}).get(table)
+            if table_type is not None:
+                is_view = table_type in ('VIEW', 'MATERIALIZED_VIEW')
+                if (kind == 'TABLE') == is_view:
+                    raise ValueError(f'Cannot {statement}: {catalog}.{schema}.{table} is a {table_type}.')
+                del self.catalogs[catalog][schema][table]
+            return _Result([])
+
+        raise NotImplementedError(f'LocalCatalogSpark does not support the statement: {query}')
+
+
+class LocalDBAcademyHelper:
+    """
+    Stand-in for DBAcademyHelper with the catalog name and working directory used by the setup notebooks.
+    """
+
+    def __init__(self, catalog_name: str = 'dbacademy', working_dir: str = None):
+        self.catalog_name = catalog_name
+        self.paths = types.SimpleNamespace(working_dir = working_dir)
+
+    def init(self):
+        pass
+
+
+def _install_databricks_sdk_stand_in():
+    '''
+    Registers a databricks.sdk module with a WorkspaceClient that cannot be used, if the SDK is not installed,
+    so the notebook cell that imports it can still be loaded.
+    '''
+    try:
+        import databricks.sdk
+    except ImportError:
+        class WorkspaceClient:
+            def __init__(self, *args, **kwargs):
+                raise NotImplementedError('The Databricks SDK is not available when running the setup helpers locally.')
+
+        databricks_module = types.ModuleType('databricks')
+        sdk_module = types.ModuleType('databricks.sdk')
+        sdk_module.WorkspaceClient = WorkspaceClient
+        databricks_module.sdk = sdk_module
+        sys.modules.setdefault('databricks', databricks_module)
+        sys.modules.setdefault('databricks.sdk', sdk_module)
+
+
+def load_setup_notebook(notebook_path: str, spark=None, dbutils=None, working_dir: str = None, namespace: dict = None) -> dict:
+    '''
+    Runs the Python cells of a setup notebook with the local stand-ins and returns the namespace with its helpers.
+
+    %run cells that include a notebook in the same Includes folder (for example %run ./Schema-Registry) are loaded into the same
+    namespace. Other cells that only contain magic commands (%run, %sql) are skipped.
+
+    Example:
+      helpers = load_setup_notebook('../Classroom-Setup-Common.py', working_dir='/tmp/labuser')
+      helpers['copy_files'](copy_from='/tmp/source', copy_to='/tmp/labuser/orders', n=10, mode='fast')
+    '''
+    _install_databricks_sdk_stand_in()
+
+    if namespace is None:
+        namespace = {
+            'spark': spark if spark is not None else LocalCatalogSpark(),
+            'dbutils': dbutils if dbutils is not None else LocalDbutils(),
+            'DBAcademyHelper': lambda: LocalDBAcademyHelper(working_dir = working_dir),
+            'displayHTML': print
+        }
+
+    with open(notebook_path) as f:
+        source = f.read()
+
+    for cell in source.split('# COMMAND ----------'):
+        run_match = re.search(r'^# MAGIC %run \./(\S+)$', cell, re.MULTILINE)
+        if run_match and os.path.exists(os.path.join(os.path.dirname(notebook_path), run_match.group(1) + '.py')):
+            load_setup_notebook(os.path.join(os.path.dirname(notebook_path), run_match.group(1) + '.py'), namespace = namespace)
+            continue
+
+        code_lines = [line for line in cell.splitlines() if line.strip() and not line.startswith('# MAGIC') and line.strip() != '# Databricks notebook source']
+        if not code_lines:
+            continue
+        exec(compile(cell, notebook_path, 'exec'), namespace)
+
+    return namespace